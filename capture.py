@@ -0,0 +1,215 @@
+import argparse
+import logging
+import mmap
+import os
+import struct
+import time
+
+
+# ---------------------------------------------------------------------------------------------- #
+# |                   |                                                                        | #
+# |   MAGIC/VERSION   |   RECORD   |   RECORD   |   ...                                          | #
+# |      8 bytes      |                                                                        | #
+# ---------------------------------------------------------------------------------------------- #
+# |                   |          |          |                                                  | #
+# |     TIMESTAMP     |   DIR    |   LEN    |                     PDU                          | #
+# |  8 bytes (float)  |  1 byte  | 2 bytes  |                  LEN bytes                       | #
+# ---------------------------------------------------------------------------------------------- #
+
+
+logging.basicConfig()
+logger = logging.getLogger("capture")
+
+CAPTURE_MAGIC = b"ETHCAP\x00\x01"
+
+# directions, from the point of view of the node that made the capture
+CAPTURE_RX = 0
+CAPTURE_TX = 1
+
+
+class CaptureWriter:
+    """Append-only writer of raw ZMQ PDUs.
+
+    Records are appended as they happen, so a capture cut short by a crash is
+    still readable up to the last complete record.
+    """
+
+    record_format = "<dBH"
+    record_size = struct.calcsize(record_format)
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.file = open(filename, "ab")
+        if self.file.tell() == 0:
+            self.file.write(CAPTURE_MAGIC)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, direction: int, pdu: bytes, timestamp: float = None):
+        if timestamp is None:
+            timestamp = time.time()
+        if len(pdu) > 0xFFFF:
+            raise ValueError(f"PDU must be at most 65535 bytes ({len(pdu)}).")
+        # one write per record so records from the send and receive threads never interleave
+        self.file.write(
+            struct.pack(self.record_format, timestamp, direction, len(pdu)) + pdu
+        )
+
+    def close(self):
+        self.file.close()
+
+
+class CaptureReader:
+    """Memory-mapped reader of a capture file.
+
+    Records are read straight out of the mapping, so iterating a capture never
+    loads more than the record currently being handed out.
+    """
+
+    record_format = CaptureWriter.record_format
+    record_size = CaptureWriter.record_size
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.file = open(filename, "rb")
+        if os.fstat(self.file.fileno()).st_size < len(CAPTURE_MAGIC):
+            self.file.close()
+            raise ValueError(f"{filename} is not an EthaNET capture")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[: len(CAPTURE_MAGIC)] != CAPTURE_MAGIC:
+            self.close()
+            raise ValueError(f"{filename} is not an EthaNET capture")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __iter__(self):
+        """Yield (timestamp, direction, pdu) for every complete record."""
+        buf = self.map
+        end = len(buf)
+        offset = len(CAPTURE_MAGIC)
+        while offset + self.record_size <= end:
+            timestamp, direction, length = struct.unpack_from(
+                self.record_format, buf, offset
+            )
+            offset += self.record_size
+            if offset + length > end:
+                logger.warning(f"Truncated record at the end of {self.filename}")
+                break
+            yield timestamp, direction, buf[offset : offset + length]
+            offset += length
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+def replay(
+    ethan,
+    filename: str,
+    direction: int = CAPTURE_RX,
+    realtime: bool = False,
+) -> dict:
+    """Feed the recorded PDUs of one direction into EthaNET.process_pdu().
+
+    Args:
+        ethan (EthaNET): node to run the receive pipeline of
+        filename (str): capture file
+        direction (int): which recorded direction to replay
+        realtime (bool): keep the original spacing between PDUs instead of running flat out
+
+    Returns:
+        dict: number of frames, kept packets, elapsed seconds and frames per second
+    """
+    frames = 0
+    kept = 0
+    first_timestamp = None
+    with CaptureReader(filename) as reader:
+        start = time.perf_counter()
+        for timestamp, pdu_direction, pdu in reader:
+            if pdu_direction != direction:
+                continue
+            if realtime:
+                if first_timestamp is None:
+                    first_timestamp = timestamp
+                delay = (timestamp - first_timestamp) - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            packet = ethan.process_pdu(pdu)
+            frames += 1
+            if packet is not None:
+                kept += 1
+        elapsed = time.perf_counter() - start
+
+    return {
+        "frames": frames,
+        "kept": kept,
+        "seconds": elapsed,
+        "fps": frames / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def main(verbose, capture_file, address, realtime, tx):
+    from ethaNET import EthaNET
+
+    logger.setLevel(verbose)
+    # the replay node only needs sockets to exist, nothing is listening on them
+    ethan = EthaNET(
+        source_addr=address,
+        grc_send_addr="inproc://capture-replay-tx",
+        grc_recv_addr="inproc://capture-replay-rx",
+    )
+    stats = replay(
+        ethan,
+        capture_file,
+        direction=CAPTURE_TX if tx else CAPTURE_RX,
+        realtime=realtime,
+    )
+    print(
+        f"Replayed {stats['frames']} frames ({stats['kept']} kept) in {stats['seconds']:.3f} s: {stats['fps']:.1f} frames/s"
+    )
+    logger.info(f"Receive stats: {dict(ethan.rx_stats)}")
+    logger.info(f"Link quality: {ethan.link_quality.rates()}")
+    ethan.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Replay an EthaNET capture through the receive pipeline"
+    )
+    parser.add_argument(
+        "--verbose",
+        "-v",
+        action="count",
+        default=1,
+        help="Sets verbosity level. The more added the higher the verbosity. -vv is the highest and will print debug statements",
+    )
+    parser.add_argument("capture_file", type=str, help="Capture file to replay")
+    parser.add_argument(
+        "--address",
+        "-a",
+        type=int,
+        default=0,
+        help="Address of the replaying node (0) [0-255]",
+    )
+    parser.add_argument(
+        "--realtime",
+        action="store_true",
+        help="Replay at the original timing instead of as fast as possible",
+    )
+    parser.add_argument(
+        "--tx",
+        action="store_true",
+        help="Replay the transmitted PDUs instead of the received ones",
+    )
+
+    args = parser.parse_args()
+    args.verbose = 40 - (10 * args.verbose) if args.verbose > 0 else 0
+    main(**vars(args))
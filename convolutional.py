@@ -0,0 +1,244 @@
+import numpy as np
+import logging
+from fractions import Fraction
+
+
+# Puncturing patterns per code rate for the rate 1/2 mother code, one row per
+# generator and one column per input bit. A 0 marks a coded bit that is not sent.
+PUNCTURE_PATTERNS = {
+    Fraction(1, 2): [[1], [1]],
+    Fraction(2, 3): [[1, 1], [1, 0]],
+    Fraction(3, 4): [[1, 1, 0], [1, 0, 1]],
+    Fraction(5, 6): [[1, 1, 0, 1, 0], [1, 0, 1, 0, 1]],
+}
+RATES = list(PUNCTURE_PATTERNS)
+
+
+class _convolutional:
+    def __init__(self, rate=Fraction(1, 2), constraint_length: int = 7, generators=(0o133, 0o171)):
+        self.rate = Fraction(rate)
+        if self.rate not in PUNCTURE_PATTERNS:
+            raise ValueError(f"Rate must be one of {[str(r) for r in RATES]} ({rate}).")
+        self.K = int(constraint_length)
+        self.generators = tuple(generators)
+        self.numStates = 2 ** (self.K - 1)
+
+        # taps[i, d] multiplies the input bit delayed by d, the generator MSB is the current bit
+        self.taps = np.array(
+            [[(g >> (self.K - 1 - d)) & 1 for d in range(self.K)] for g in self.generators],
+            dtype=np.uint8,
+        )
+        self.puncture = np.array(PUNCTURE_PATTERNS[self.rate], dtype=bool)
+
+    def __repr__(self):
+        return f"Conv(K={self.K}, g={tuple(oct(g) for g in self.generators)}) object punctured to rate {self.rate}."
+
+    def _keepMask(self, numInputs: int) -> np.ndarray:
+        """Which mother code bits survive puncturing, in transmit order
+
+        Args:
+            numInputs (int): number of encoder input bits, tail included
+
+        Returns:
+            np.ndarray: (numInputs * number of generators) boolean mask
+        """
+        period = self.puncture.shape[1]
+        reps = -(-numInputs // period)
+        return np.tile(self.puncture, reps)[:, :numInputs].T.ravel()
+
+    def codedLength(self, numBits: int) -> int:
+        """Number of transmitted bits for numBits information bits"""
+        return int(self._keepMask(numBits + self.K - 1).sum())
+
+    def _encode(self, message: np.ndarray) -> np.ndarray:
+        message = np.atleast_2d(np.asarray(message, dtype=np.uint8))
+        numMessages, numBits = message.shape
+        # K-1 zero tail bits bring the encoder back to state 0
+        numInputs = numBits + self.K - 1
+        padded = np.zeros((numMessages, numInputs + self.K - 1), dtype=np.uint8)
+        padded[:, self.K - 1 : self.K - 1 + numBits] = message
+
+        coded = np.zeros((numMessages, numInputs, len(self.generators)), dtype=np.uint8)
+        for d in range(self.K):
+            delayed = padded[:, self.K - 1 - d : self.K - 1 - d + numInputs]
+            coded ^= delayed[:, :, None] * self.taps[:, d]
+        coded = coded.reshape(numMessages, -1)
+        return coded[:, self._keepMask(numInputs)]
+
+
+class encoder(_convolutional):
+    def encode(self, message: np.ndarray) -> np.ndarray:
+        """Encode messages into terminated, punctured codewords
+
+        Args:
+            message (np.ndarray): (number of messages x message length) matrix of bits, a vector is one message
+
+        Returns:
+            np.ndarray: (number of messages x coded length) matrix of coded bits
+        """
+        return self._encode(message)
+
+    def encode_frame(self, data: bytes) -> bytes:
+        """Encode a byte payload into a frame
+
+        The payload length follows from the frame length, since every extra
+        payload byte adds at least one coded byte, so nothing else is sent.
+
+        Args:
+            data (bytes): payload to encode
+
+        Returns:
+            bytes: coded bits packed MSB first, the last byte zero-filled
+        """
+        bits = np.unpackbits(np.frombuffer(bytes(data), dtype=np.uint8))
+        return np.packbits(self.encode(bits)).tobytes()
+
+
+class decoder(_convolutional):
+    def __init__(self, rate=Fraction(1, 2), constraint_length: int = 7, generators=(0o133, 0o171)):
+        _convolutional.__init__(self, rate, constraint_length, generators)
+
+        # Trellis in butterflies: next state 2j + u is reached from states j
+        # (msb 0) and j + numStates/2 (msb 1) on input u. branchSymbol[msb, j, u]
+        # indexes the generator outputs of that branch as a number.
+        half = self.numStates // 2
+        j = np.arange(half).reshape(1, -1, 1)
+        msb = np.arange(2).reshape(-1, 1, 1)
+        u = np.arange(2).reshape(1, 1, -1)
+        register = (((j + msb * half) << 1) | u).astype(np.int64)  # bit d = input delayed by d
+        self.branchSymbol = np.zeros((2, half, 2), dtype=np.intp)
+        for i in range(len(self.generators)):
+            mask = sum(int(self.taps[i, d]) << d for d in range(self.K))
+            bit = np.array([bin(r).count("1") & 1 for r in (register & mask).ravel()])
+            self.branchSymbol |= bit.reshape(register.shape) << (len(self.generators) - 1 - i)
+
+        # bipolar value of every generator output for each branch symbol, bit 0 -> +1 and bit 1 -> -1
+        numSymbols = 2 ** len(self.generators)
+        symbolBits = (
+            np.arange(numSymbols).reshape(-1, 1) >> np.arange(len(self.generators))[::-1]
+        ) & 1
+        self.symbolSigns = (1 - 2 * symbolBits).astype(np.float32).T
+
+        # coded frame length in bytes -> payload length in bytes
+        self.frameLengths = {
+            -(-self.codedLength(8 * n) // 8): n for n in range(256)
+        }
+
+    def _numInputs(self, codedLength: int) -> tuple:
+        """Encoder inputs, tail included, behind a coded length and the coded bits they use"""
+        perInput = self.puncture.sum(axis=0)
+        periods = codedLength // perInput.sum() + 1
+        cumulative = np.cumsum(np.tile(perInput, periods))
+        numInputs = int(np.searchsorted(cumulative, codedLength, side="right"))
+        if numInputs < self.K - 1:
+            raise ValueError(f"Codeword is shorter than the tail ({codedLength}).")
+        return numInputs, int(cumulative[numInputs - 1])
+
+    def _depuncture(self, received: np.ndarray, numInputs: int) -> np.ndarray:
+        """Put punctured positions back as zero (no information) soft values"""
+        full = np.zeros((received.shape[0], numInputs * len(self.generators)), dtype=np.float32)
+        full[:, self._keepMask(numInputs)] = received
+        return full.reshape(received.shape[0], numInputs, len(self.generators))
+
+    def decode(self, codeword: np.ndarray, soft: bool = False, stats: bool = False) -> np.ndarray:
+        """Viterbi decode a batch of codewords
+
+        Add-compare-select runs on every state of every codeword in the batch
+        at once, so decoding many frames together costs little more than one.
+
+        Args:
+            codeword (np.ndarray): (number of codewords x coded length) matrix, a vector is one codeword
+            soft (bool): input is bipolar soft values (positive for bit 0, 0 for no information) instead of bits
+            stats (bool): also return the number of received bits the decoded path disagrees with in each codeword
+
+        Returns:
+            np.ndarray: (number of codewords x message length) matrix of decoded bits, and with
+                stats the (number of codewords,) corrected bit counts
+        """
+        codeword = np.atleast_2d(np.asarray(codeword))
+        if soft:
+            received = codeword.astype(np.float32)
+        else:
+            received = 1 - 2 * codeword.astype(np.float32)
+        numInputs, codedLength = self._numInputs(codeword.shape[1])
+        numBits = numInputs - (self.K - 1)
+        received = received[:, :codedLength]
+        numCodewords = received.shape[0]
+        half = self.numStates // 2
+
+        # correlation of every received step with every branch symbol, for all steps up front.
+        # branchMetrics[t, n, msb, j, u] belongs to the branch from state j + msb * half
+        # to state 2j + u, so one add covers both halves of every butterfly.
+        symbolMetrics = self._depuncture(received, numInputs) @ self.symbolSigns
+        branchMetrics = np.ascontiguousarray(
+            np.moveaxis(symbolMetrics[:, :, self.branchSymbol], 1, 0)
+        )
+
+        # The loops run once per input bit on small arrays, so numpy call overhead
+        # dominates. Add-compare-select works in place: every step adds the path
+        # metrics into its own branch metrics and keeps the larger of each pair,
+        # and all the comparisons are made at once afterwards.
+        # the encoder starts in state 0
+        pathMetric = np.full((numCodewords, self.numStates), -np.inf, dtype=np.float32)
+        pathMetric[:, 0] = 0
+        fromStates = pathMetric.reshape(numCodewords, 2, half, 1)
+        toStates = pathMetric.reshape(numCodewords, half, 2)
+        fromLo, fromHi = branchMetrics[:, :, 0], branchMetrics[:, :, 1]
+        for candidates, lo, hi in zip(branchMetrics, fromLo, fromHi):
+            np.add(fromStates, candidates, out=candidates)
+            np.maximum(lo, hi, out=toStates)
+        decisions = fromHi > fromLo
+
+        # predecessor of every state at every step, as a flat index over the batch
+        offsets = np.arange(numCodewords).reshape(-1, 1) * self.numStates
+        states = np.arange(self.numStates)
+        previous = (
+            (states >> 1) | (decisions.reshape(numInputs, numCodewords, -1) << (self.K - 2))
+        ) + offsets
+        previous = previous.reshape(numInputs, -1)
+
+        # trace back from state 0, where the tail leaves the encoder. The input bit of
+        # each step is the low bit of the state it leads to.
+        path = np.empty((numInputs, numCodewords), dtype=np.intp)
+        path[-1] = state = offsets.ravel()
+        for t in range(numInputs - 1, 0, -1):
+            state = previous[t][state]
+            path[t - 1] = state
+        bits = (path.T & 1).astype(np.uint8)
+        if stats:
+            # re-encoding is a K step loop, small next to the trellis. A received
+            # value with the opposite sign of the re-encoded bit was corrected.
+            recoded = 1 - 2 * self._encode(bits[:, :numBits]).astype(np.float32)
+            return bits[:, :numBits], np.count_nonzero(received * recoded < 0, axis=1)
+        return bits[:, :numBits]
+
+    def decode_frame(self, coded: bytes, stats: bool = False) -> bytes:
+        """Decode a frame created by encoder.encode_frame() back into its payload
+
+        Args:
+            coded (bytes): coded bits packed MSB first
+            stats (bool): also return the frame's correction statistics
+
+        Returns:
+            bytes: decoded payload, and with stats a dict of the number of "codewords" (always 1),
+                the bits "corrected" and whether the frame was "uncorrectable", which the Viterbi
+                decoder can only tell when no payload length codes to the frame length
+        """
+        numBytes = self.frameLengths.get(len(coded))
+        if numBytes is None:
+            logging.getLogger("convolutional").debug(
+                f"No payload length codes to {len(coded)} bytes"
+            )
+            if stats:
+                return b"", {"codewords": 1, "corrected": 0, "uncorrectable": 1}
+            return b""
+        bits = np.unpackbits(np.frombuffer(bytes(coded), dtype=np.uint8))
+        bits = bits[: self.codedLength(8 * numBytes)]
+        if stats:
+            decoded, corrected = self.decode(bits, stats=True)
+            return np.packbits(decoded).tobytes(), {
+                "codewords": 1,
+                "corrected": int(corrected[0]),
+                "uncorrectable": 0,
+            }
+        return np.packbits(self.decode(bits)).tobytes()
@@ -2,14 +2,54 @@ from utils import *
 import random
 import time
 import pmt
+import queue
+import threading
 import zmq
 import logging
+from collections import Counter, OrderedDict, defaultdict, deque
 import hamming as hamm
-import byteTransforms as bt
+import convolutional as conv
+from capture import CAPTURE_RX, CAPTURE_TX, CaptureWriter
+from linkquality import LinkQuality
+from scheduler import PRIORITY_DATA, TxScheduler
 
 logging.basicConfig()
 logger = logging.getLogger("ethanNet")
 
+# MCS byte -> (FEC module, coder arguments) used to code the payload
+MCS_FEC = {
+    **{mcs: (hamm, {"order": order}) for mcs, order in enumerate(hamm.FRAME_ORDERS)},
+    **{
+        mcs: (conv, {"rate": rate})
+        for mcs, rate in enumerate(conv.RATES, start=len(hamm.FRAME_ORDERS))
+    },
+}
+
+# frames sent here are delivered to every node and never ACKed
+BROADCAST_ADDR = 255
+
+# ACKs go out at the most robust MCS with the ACK flag set in the MCS byte.
+# send() only takes MCS values in MCS_FEC, so application frames never carry it.
+ACK_MCS = 0
+ACK_FLAG = 0x80
+ACK_PAYLOAD = b"ACK"
+
+# span of sequence numbers per destination, from the oldest frame still waiting
+# for an ACK, that may be in flight at once
+SEND_WINDOW = 8
+# transmissions of a frame, the first included, before it is given up on
+MAX_ATTEMPTS = 8
+# longest the receive thread waits on the socket before running the retransmission timers, ms
+RX_POLL_INTERVAL = 100
+# frames delivered to this node but not yet taken by receive(), the oldest is dropped beyond it
+RX_QUEUE_SIZE = 256
+# number of sources whose recent sequence numbers are kept for duplicate suppression
+DUPLICATE_TABLE_SIZE = 64
+# number of ACK turnaround samples kept
+ACK_TURNAROUND_HISTORY = 1024
+# number of frames the FEC error rates are taken over, per source and per MCS
+LINK_QUALITY_HISTORY = 256
+
 
 # ---------------------------------------------------------------------------------------------- #
 # |          |          |          |          |          |          |                          | #
@@ -24,91 +64,298 @@ class EthaNET:
         source_addr: int = 1,
         grc_send_addr: str = "tcp://0.0.0.0:5555",
         grc_recv_addr: str = "tcp://127.0.0.1:5556",
+        capture: CaptureWriter = None,
+        ack_timeout: int = 50,
     ):
         self.source_addr = source_addr
-        self.send_seq_num = 0
+        self.ack_timeout = ack_timeout  # ms to wait for an ACK before backing off
+        # every PDU sent or received is recorded here when given
+        self.capture = capture
+
+        # per peer sequence state
+        self.send_seq_nums = defaultdict(int)  # dest -> seq of the next new message
+        self.recv_seq_nums = OrderedDict()  # source -> recent seqs received, oldest source first
+        self.ack_turnaround_us = deque(maxlen=ACK_TURNAROUND_HISTORY)
+
+        # frames waiting for an ACK, guarded by the condition
+        self._pending = defaultdict(OrderedDict)  # dest -> seq -> PendingFrame, oldest first
+        self._pending_cond = threading.Condition()
+        # frames delivered to this node, filled by the receive thread
+        self.rx_queue = queue.Queue(maxsize=RX_QUEUE_SIZE)
+
+        # how many frames made it to, or were dropped at, each receive stage
+        self.rx_stats = Counter()
+        # how sent frames ended up
+        self.tx_stats = Counter()
+        # rolling CRC failure and FEC correction rates of frames addressed to this node
+        self.link_quality = LinkQuality(LINK_QUALITY_HISTORY)
+
+        # coders are slow to initialize so build one per MCS up front
+        self.encoders = {mcs: fec.encoder(**args) for mcs, (fec, args) in MCS_FEC.items()}
+        self.decoders = {mcs: fec.decoder(**args) for mcs, (fec, args) in MCS_FEC.items()}
 
         self.context = None
         self.grc_send_addr = grc_send_addr
         self._open_send_socket()
 
+        # the scheduler's sender loop is the only user of the send socket
+        self.scheduler = TxScheduler(self._transmit)
+        self.scheduler.start()
+
         self.grc_recv_addr = grc_recv_addr
         self._open_recv_socket()
 
-    def send(self, data: bytes, dest_addr, mcs_level):
-        # generate packet
-        packet = Packet(mcs_level, self.send_seq_num, dest_addr, self.source_addr)
+        # the ACK payload never changes so it is coded once into the transmit template
+        ack_payload = self.encoders[ACK_MCS].encode_frame(ACK_PAYLOAD)
+        ack_frame = Packet(ACK_FLAG | ACK_MCS, 0, 0, 0).pack(ack_payload, ACK_PAYLOAD)
+        self._ack_template = AckTemplate(
+            ACK_FLAG | ACK_MCS, ack_payload, ACK_PAYLOAD, self._serialize_prefix(ack_frame)
+        )
+
+        # the receive thread is the only user of the receive socket
+        self._running = True
+        self._rx_thread = threading.Thread(target=self._rx_loop, name="EthaNET-rx", daemon=True)
+        self._rx_thread.start()
+
+    def send(self, data: bytes, dest_addr, mcs_level, priority: int = PRIORITY_DATA) -> bool:
+        """Send a message and block until it is ACKed or given up on.
+
+        Returns:
+            bool: True if the message was ACKed
+        """
+        return self.send_async(data, dest_addr, mcs_level, priority).wait()
+
+    def send_async(
+        self, data: bytes, dest_addr, mcs_level, priority: int = PRIORITY_DATA
+    ) -> "PendingFrame":
+        """Queue a message for transmission and return without waiting for its ACK.
+
+        The receive thread retransmits the frame with backoff until it is ACKed
+        or MAX_ATTEMPTS transmissions went unanswered. A new sequence number
+        is at most SEND_WINDOW ahead of the oldest frame to the same
+        destination still waiting for its ACK, until then this blocks.
+
+        Args:
+            data (bytes): message to send
+            dest_addr (int): destination address, BROADCAST_ADDR frames are sent once and never ACKed
+            mcs_level (int): MCS of the payload, one of MCS_FEC
+            priority (int): scheduler priority class
+
+        Returns:
+            PendingFrame: wait() on it for the outcome
+        """
+        if mcs_level not in self.encoders:
+            raise ValueError(
+                f"MCS must be one of {list(self.encoders)} ({mcs_level})."
+            )
 
         # add encoding to the payload
-        #*********************** FIX ***************************
-        # encoder should be put in the constructor because its slow to intialize
-        # the .encode() method expects a reshaped numpy array
-        Encoder = hamm.encoder(order=3)
-        coded_data = bt.bitListToPacket(Encoder.encode(bt.packetToBitList(data)))
-        #*********************** FIX ***************************
-
-        # first 6 bytes are the header and the rest is payload
-        packet_bytes = packet.pack(coded_data)
-
-        # we need to now set up the aloha scheme
-        # we will try to transmit and see if we get an ACK back
-        # we try at first, if we fail we do some exponential backoff and send again until we get an ack
-        num_attempts = 1
-        while True:
-            # send our bytes through the socket
-            serialized_packet_bytes = self._serialize_packet(packet_bytes)
-            logger.debug(f"Sending packet to {dest_addr} with seq {self.send_seq_num}")
-            self.send_socket.send(serialized_packet_bytes)
-
-            # logger.debug(f"Listening for response from GNURADIO at {self.grc_recv_addr}")
-            ack_packet = self.receive(timeout=50)
-            if ack_packet is None:
-                logger.debug(f"No ACK received for seq: {self.send_seq_num}")
-                break # TODO remove this once done debugging
-            elif self._ack_recv(ack_packet):
-                logger.debug(f"Received ACK for seq: {self.send_seq_num}")
-                # increment the sequence number
-                self.send_seq_num += 1
-                break
-
-            k = min(num_attempts, 10)  # capped at 10
-            R = random.uniform(0, 2**k - 1)
-            backoff_time = R * self._calc_frame_time(mcs_level)
-            logger.debug(
-                f"\t\tBacking off for the {num_attempts}th time. backoff {backoff_time}"
+        coded_data = self.encoders[mcs_level].encode_frame(data)
+
+        with self._pending_cond:
+            self._pending_cond.wait_for(
+                lambda: not self._running or self._in_window(dest_addr)
             )
-            time.sleep(backoff_time)
-            num_attempts += 1
+            if not self._running:
+                # nothing would retransmit the frame or settle it
+                raise RuntimeError("EthaNET is closed or its receive thread stopped.")
+            # generate packet, a new message always takes the next sequence number
+            # and only retransmissions of it reuse this one
+            seq_num = self.send_seq_nums[dest_addr]
+            self.send_seq_nums[dest_addr] = (seq_num + 1) % 256
+            packet = Packet(mcs_level, seq_num, dest_addr, self.source_addr)
 
-    def receive(self, timeout=60000):
-        self.recv_socket.setsockopt(zmq.RCVTIMEO, timeout)
+            # first 6 bytes are the header and the rest is payload, the CRC covers the message
+            pdu = self._serialize_packet(packet.pack(coded_data, data))
+            frame = PendingFrame(pdu, dest_addr, seq_num, mcs_level, priority)
+
+            # registered before it is queued so its ACK cannot arrive first
+            if dest_addr != BROADCAST_ADDR:
+                frame.deadline = time.perf_counter() + self.ack_timeout / 1000
+                self._pending[dest_addr][seq_num] = frame
+
+        logger.debug(f"Sending packet to {dest_addr} with seq {seq_num}")
+        if not self.scheduler.enqueue(pdu, dest_addr, priority):
+            # handled like a lost frame, the retransmission timer still runs
+            logger.debug(f"Transmit queue for {dest_addr} full, dropped seq {seq_num}")
+        if dest_addr == BROADCAST_ADDR:
+            self.tx_stats["broadcast"] += 1
+            frame.done.set()
+        return frame
+
+    def flush(self, timeout: float = None) -> bool:
+        """Wait until every frame sent so far is ACKed or given up on.
+
+        Frames still pending when the receive thread stops are given up on.
+
+        Args:
+            timeout (float): seconds to wait, forever if None
 
+        Returns:
+            bool: False if frames were still waiting when the timeout ran out
+        """
+        with self._pending_cond:
+            return self._pending_cond.wait_for(
+                lambda: not any(self._pending.values()), timeout
+            )
+
+    def receive(self, timeout=60000):
+        """Next frame delivered to this node, or None after timeout ms."""
         try:
-            data_in = self.recv_socket.recv()
-        except zmq.Again:
+            return self.rx_queue.get(timeout=timeout / 1000)
+        except queue.Empty:
             return None  # Indicate timeout occurred
 
+    def close(self):
+        """Stop the receive and sender threads and close the sockets."""
+        self._running = False
+        self._rx_thread.join()
+        self.scheduler.stop()
+        self.recv_socket.close()
+        self.send_socket.close()
+
+    def _rx_loop(self):
+        """Receive thread, the only user of the receive socket.
+
+        Delivered frames go on rx_queue, ACKs settle pending frames and
+        between frames the retransmission timers are run. A frame the receive
+        pipeline fails on is counted as malformed and dropped. If the thread
+        stops for any reason the frames still pending are given up on, so
+        nothing waits for them forever.
+        """
+        try:
+            while self._running:
+                timeout = self._service_pending()
+                if not self.recv_socket.poll(timeout):
+                    continue
+                data_in = self.recv_socket.recv()
+                recv_time = time.perf_counter_ns()
+                if self.capture is not None:
+                    self.capture.write(CAPTURE_RX, data_in)
+
+                try:
+                    packet = self.process_pdu(data_in, recv_time)
+                except Exception:
+                    # corrupted fields can still reach the decoders, the link must outlive them
+                    self.rx_stats["malformed"] += 1
+                    logger.debug("Dropped a frame the receive pipeline failed on", exc_info=True)
+                    continue
+                if packet is None:
+                    continue
+                if packet.mcs & ACK_FLAG:
+                    self._ack_recv(packet)
+                else:
+                    self._deliver(packet)
+        finally:
+            with self._pending_cond:
+                self._running = False
+                for frames in list(self._pending.values()):
+                    for frame in list(frames.values()):
+                        self._settle(frame, acked=False)
+                self._pending_cond.notify_all()
+
+    def _deliver(self, packet: Packet):
+        """Queue a frame for receive(), dropping the oldest one when the queue is full."""
+        while True:
+            try:
+                self.rx_queue.put_nowait(packet)
+                return
+            except queue.Full:
+                try:
+                    self.rx_queue.get_nowait()
+                    self.rx_stats["rx_queue_dropped"] += 1
+                except queue.Empty:
+                    pass  # receive() made room first
+
+    def process_pdu(self, data_in: bytes, recv_time: int = None):
+        """Run a serialized PDU through the receive pipeline.
+
+        The header is parsed first so frames for other nodes are dropped
+        before their payload is touched. The CRC covers the header and the
+        decoded payload, so a kept frame is decoded and then checked, and
+        only a frame that passes is ACKed and delivered. The FEC can then
+        repair channel errors in the payload, while a frame it could not
+        repair fails the CRC.
+
+        Args:
+            data_in (bytes): serialized PDU as it arrives from GNU Radio
+            recv_time (int): perf_counter_ns() timestamp of arrival, used for ACK turnaround
+
+        Returns:
+            Packet: the received packet, or None if it was dropped
+        """
+        if recv_time is None:
+            recv_time = time.perf_counter_ns()
+        self.rx_stats["received"] += 1
+
         # Create packet object from deserialized bytes
         packet = self._deserialize_packet(data_in)
+        if len(packet) < Packet.header_size:
+            self.rx_stats["malformed"] += 1
+            logger.debug("Frame shorter than a header! Discarding packet")
+            return None
 
         # Separate the header from encoded payload
-        header = packet[:6]
-        coded_payload = packet[6:]
+        header = packet[: Packet.header_size]
+        coded_payload = packet[Packet.header_size :]
+
+        packet = Packet.unpack_header(header)
+
+        # Drop frames for other nodes before touching the payload
+        if packet.dest_addr not in (self.source_addr, BROADCAST_ADDR):
+            self.rx_stats["filtered_address"] += 1
+            return None
+
+        # ACKs are recognized by their header flag and their payload is known,
+        # so they are checked without decoding
+        if packet.mcs & ACK_FLAG:
+            if not packet.validate_checksum(ACK_PAYLOAD):
+                self.rx_stats["bad_checksum"] += 1
+                logger.debug("Invalid ACK checksum! Discarding packet")
+                return None
+            self.rx_stats["ack"] += 1
+            packet.payload = ACK_PAYLOAD
+            return packet
+
+        if packet.mcs not in self.decoders:
+            self.rx_stats["unknown_mcs"] += 1
+            logger.debug(f"Unknown MCS {packet.mcs}! Discarding packet")
+            return None
+
+        self.rx_stats["decoded"] += 1
+        payload, fec_stats = self.decoders[packet.mcs].decode_frame(coded_payload, stats=True)
 
         # Validate checksum
-        if not Packet.validate_checksum(coded_payload):
+        if not packet.validate_checksum(payload):
+            self.rx_stats["bad_checksum"] += 1
             logger.debug("Invalid checksum! Discarding packet")
+            # nothing vouches for the SRC of a failed frame, so it only counts towards its MCS
+            self.link_quality.record(None, packet.mcs, fec_stats, crc_failed=True)
             return None  # Explicitly return None for invalid packets
 
-        # Decode payload
-        Decoder = hamm.decoder(order=3)
-        payload = bt.bitListToPacket(Decoder.decode(bt.packetToBitList(coded_payload)))
+        self.link_quality.record(packet.source_addr, packet.mcs, fec_stats)
 
-        packet = Packet.unpack_header(header)
+        # ACK as soon as the frame is known good
+        if packet.dest_addr == self.source_addr:
+            self._send_ack(packet, recv_time)
+            if self._is_duplicate(packet):
+                self.rx_stats["duplicate"] += 1
+                logger.debug(
+                    f"Duplicate seq {packet.sequence_number} from {packet.source_addr}! Discarding packet"
+                )
+                return None
+
+        self.rx_stats["delivered"] += 1
         packet.payload = payload
+        packet.fec_stats = fec_stats
 
         return packet
 
+    def _transmit(self, pdu: bytes):
+        self.send_socket.send(pdu)
+        if self.capture is not None:
+            self.capture.write(CAPTURE_TX, pdu)
+
     def _open_send_socket(self):
         if self.context is None:
             self.context = zmq.Context()
@@ -127,18 +374,150 @@ class EthaNET:
         # Serialize PMT to a string
         return pmt.serialize_str(pdu)
 
-    def _deserialize_packet(self, pdu: bytes):
-        # this may be a tuple of (metadata,payload), meta data would be created by gnuradio, this may just be payload depending on what gnuradio sends
-        return pmt.to_python(pmt.deserialize_str(pdu))
+    def _deserialize_packet(self, pdu: bytes) -> bytes:
+        # this may be a pair of (metadata,payload), meta data would be created by gnuradio, this may just be payload depending on what gnuradio sends
+        pdu = pmt.deserialize_str(pdu)
+        if pmt.is_pair(pdu):
+            pdu = pmt.cdr(pdu)
+        return bytes(pmt.u8vector_elements(pdu))
+
+    def _serialize_prefix(self, packet: bytes) -> bytes:
+        """Serialization envelope that precedes the raw bytes of a serialized packet."""
+        serialized = self._serialize_packet(packet)
+        if not serialized.endswith(packet):
+            raise ValueError("Serialized PDU does not end with the raw packet bytes")
+        return serialized[: -len(packet)]
+
+    def _send_ack(self, packet: Packet, recv_time: int):
+        ack = self._ack_template.frame(
+            packet.sequence_number, packet.source_addr, self.source_addr
+        )
+        self.scheduler.enqueue_ack(ack)
+        self.ack_turnaround_us.append((time.perf_counter_ns() - recv_time) / 1000)
+        logger.debug(
+            f"ACKed seq {packet.sequence_number} from {packet.source_addr} in {self.ack_turnaround_us[-1]:.1f} us"
+        )
+
+    def _is_duplicate(self, packet: Packet) -> bool:
+        """Record the frame and check whether it repeats a recent one from its source.
+
+        Senders keep the frames in flight within SEND_WINDOW sequence numbers
+        of the oldest one waiting for an ACK, so a retransmission after a lost
+        ACK always repeats one of the last sequence numbers received from its
+        source.
+        """
+        recent = self.recv_seq_nums.pop(packet.source_addr, None)
+        if recent is None:
+            recent = deque(maxlen=2 * SEND_WINDOW)
+        self.recv_seq_nums[packet.source_addr] = recent
+        if len(self.recv_seq_nums) > DUPLICATE_TABLE_SIZE:
+            self.recv_seq_nums.popitem(last=False)
+        if packet.sequence_number in recent:
+            return True
+        recent.append(packet.sequence_number)
+        return False
 
     # TODO
     def _calc_frame_time(self, mcs):
         return 0.01  # TODO, actually calculate what the max frame time would be for the mcs?? or should it be max time at the lowest mcs??
 
+    def _backoff(self, frame: "PendingFrame") -> float:
+        k = min(frame.attempts, 10)  # capped at 10
+        R = random.uniform(0, 2**k - 1)
+        return R * self._calc_frame_time(frame.mcs)
+
+    def _service_pending(self) -> int:
+        """Retransmit or give up on frames whose timer ran out.
+
+        A frame alternates between waiting ack_timeout for its ACK and backing
+        off before its next transmission.
+
+        Returns:
+            int: ms until the next timer runs out, at most RX_POLL_INTERVAL
+        """
+        now = time.perf_counter()
+        retransmit = []
+        with self._pending_cond:
+            next_deadline = now + RX_POLL_INTERVAL / 1000
+            frames = [frame for flow in self._pending.values() for frame in flow.values()]
+            for frame in frames:
+                if now >= frame.deadline:
+                    if frame.backing_off:
+                        frame.backing_off = False
+                        frame.attempts += 1
+                        frame.deadline = now + self.ack_timeout / 1000
+                        retransmit.append(frame)
+                    elif frame.attempts >= MAX_ATTEMPTS:
+                        logger.debug(
+                            f"Giving up on seq {frame.seq_num} to {frame.dest_addr} after {frame.attempts} attempts"
+                        )
+                        self._settle(frame, acked=False)
+                        continue
+                    else:
+                        backoff_time = self._backoff(frame)
+                        logger.debug(
+                            f"\t\tBacking off seq {frame.seq_num} for the {frame.attempts}th time. backoff {backoff_time}"
+                        )
+                        frame.backing_off = True
+                        frame.deadline = now + backoff_time
+                next_deadline = min(next_deadline, frame.deadline)
+
+        for frame in retransmit:
+            logger.debug(f"Resending packet to {frame.dest_addr} with seq {frame.seq_num}")
+            # never block the receive thread, a full queue counts as a lost transmission
+            self.scheduler.enqueue(frame.pdu, frame.dest_addr, frame.priority, timeout=0)
+        return max(int((next_deadline - time.perf_counter()) * 1000), 0)
+
     def _ack_recv(self, packet: Packet):
-        # check if the packet is an ack packet
-        if packet.sequence_number != self.send_seq_num:
-            return False
-        if packet.payload != b"ACK":
-            return False
-        return True
+        # settle the pending frame the ACK is for, stale and unknown ACKs are ignored
+        if packet.dest_addr != self.source_addr:
+            return
+        with self._pending_cond:
+            frame = self._pending[packet.source_addr].get(packet.sequence_number)
+            if frame is not None:
+                logger.debug(f"Received ACK for seq: {packet.sequence_number}")
+                self._settle(frame, acked=True)
+
+    def _in_window(self, dest_addr: int) -> bool:
+        """Whether the next sequence number to dest_addr may be sent. Must hold the pending condition."""
+        flow = self._pending[dest_addr]
+        if not flow:
+            return True
+        oldest = next(iter(flow))
+        return (self.send_seq_nums[dest_addr] - oldest) % 256 < SEND_WINDOW
+
+    def _settle(self, frame: "PendingFrame", acked: bool):
+        """Finish a pending frame. Must hold the pending condition."""
+        del self._pending[frame.dest_addr][frame.seq_num]
+        self.tx_stats["acked" if acked else "failed"] += 1
+        frame.acked = acked
+        frame.done.set()
+        self._pending_cond.notify_all()
+
+
+class PendingFrame:
+    """A frame handed to EthaNET.send_async(), waiting for its ACK."""
+
+    def __init__(self, pdu: bytes, dest_addr: int, seq_num: int, mcs: int, priority: int):
+        self.pdu = pdu
+        self.dest_addr = dest_addr
+        self.seq_num = seq_num
+        self.mcs = mcs
+        self.priority = priority
+        self.attempts = 1
+        self.deadline = 0.0  # perf_counter() time the current wait or backoff ends
+        self.backing_off = False
+        self.acked = False
+        self.done = threading.Event()
+
+    def wait(self, timeout: float = None) -> bool:
+        """Block until the frame is ACKed or given up on.
+
+        Args:
+            timeout (float): seconds to wait, forever if None
+
+        Returns:
+            bool: True if the frame was ACKed
+        """
+        self.done.wait(timeout)
+        return self.acked
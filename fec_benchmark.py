@@ -0,0 +1,141 @@
+import argparse
+import time
+import timeit
+import numpy as np
+import gf2
+import hamming as hamm
+import convolutional as conv
+
+
+# Compares the payload FEC options on decode throughput and on the Eb/N0 they
+# need to reach a target bit error rate over BPSK with AWGN.
+
+
+def _hammingRun(order: int):
+    Encoder = hamm.encoder(order=order)
+    Decoder = hamm.decoder(order=order)
+
+    def encode(bits):
+        message = np.packbits(bits.reshape(-1, Encoder.k), axis=1)
+        return gf2.unpackRows(Encoder.encode_packed(message), Encoder.n)
+
+    def decode(received):
+        hard = (received < 0).astype(np.uint8)
+        decoded = Decoder.decode_packed(gf2.packRows(hard, Decoder.words))
+        return np.unpackbits(decoded, axis=1, count=Decoder.k)
+
+    return f"hamming({Encoder.n},{Encoder.k})", Encoder.rate, Encoder.k, encode, decode
+
+
+def _convolutionalRun(rate, soft: bool, frameBits: int):
+    Encoder = conv.encoder(rate=rate)
+    Decoder = conv.decoder(rate=rate)
+
+    def encode(bits):
+        return Encoder.encode(bits.reshape(-1, frameBits))
+
+    def decode(received):
+        if soft:
+            return Decoder.decode(received, soft=True)
+        return Decoder.decode((received < 0).astype(np.uint8))
+
+    # effective rate includes the tail
+    effectiveRate = frameBits / Encoder.codedLength(frameBits)
+    name = f"conv(1/2 punct {rate}, {'soft' if soft else 'hard'})"
+    return name, effectiveRate, frameBits, encode, decode
+
+
+def _ber(run, ebn0_db: float, numBits: int, rng) -> float:
+    name, rate, blockBits, encode, decode = run
+    numBits -= numBits % blockBits
+    bits = rng.integers(0, 2, numBits, dtype=np.uint8)
+    coded = encode(bits)
+    sigma = np.sqrt(1 / (2 * rate * 10 ** (ebn0_db / 10)))
+    received = (1 - 2 * coded.astype(np.float32)) + rng.normal(0, sigma, coded.shape).astype(np.float32)
+    return np.count_nonzero(decode(received).ravel() != bits) / numBits
+
+
+def _requiredEbN0(run, targetBer: float, ebn0s, numBits: int, rng) -> float:
+    """First Eb/N0 of the sweep below the target, interpolated in log(BER)"""
+    previous = None
+    for ebn0 in ebn0s:
+        ber = _ber(run, ebn0, numBits, rng)
+        if ber <= targetBer:
+            if previous is None or ber == 0:
+                return ebn0
+            lastEbn0, lastBer = previous
+            fraction = (np.log10(lastBer) - np.log10(targetBer)) / (
+                np.log10(lastBer) - np.log10(max(ber, 1e-12))
+            )
+            return lastEbn0 + fraction * (ebn0 - lastEbn0)
+        previous = (ebn0, ber)
+    return float("nan")
+
+
+def _throughput(run, numBits: int, rng) -> float:
+    """Decoded information bits per second on noiseless input"""
+    name, rate, blockBits, encode, decode = run
+    numBits -= numBits % blockBits
+    coded = encode(rng.integers(0, 2, numBits, dtype=np.uint8))
+    received = 1 - 2 * coded.astype(np.float32)
+    start = time.perf_counter()
+    decode(received)
+    return numBits / (time.perf_counter() - start)
+
+
+def _frameTime(run, frameBits: int, rng) -> float:
+    """Seconds to decode one frame of frameBits information bits on noiseless input"""
+    name, rate, blockBits, encode, decode = run
+    frameBits += -frameBits % blockBits
+    coded = encode(rng.integers(0, 2, frameBits, dtype=np.uint8))
+    received = 1 - 2 * coded.astype(np.float32)
+    # best of several runs, a single frame is too short to time once
+    return min(timeit.repeat(lambda: decode(received), number=10, repeat=20)) / 10
+
+
+def main(bits, target_ber, frame_bytes, seed):
+    rng = np.random.default_rng(seed)
+    ebn0s = np.arange(0, 12.5, 0.5)
+    runs = [_hammingRun(order) for order in hamm.FRAME_ORDERS]
+    for rate in conv.RATES:
+        for soft in (False, True):
+            runs.append(_convolutionalRun(rate, soft, 8 * frame_bytes))
+
+    uncoded = ("uncoded", 1.0, 1, lambda b: b.reshape(1, -1), lambda r: (r < 0).astype(np.uint8))
+    frameHeader = f"ms/{frame_bytes} B frame"
+    print(
+        f"{'code':<32} {'rate':>6} {'Eb/N0 @ BER ' + str(target_ber):>18} {'decode Mbit/s':>14} {frameHeader:>16}"
+    )
+    for run in [uncoded] + runs:
+        required = _requiredEbN0(run, target_ber, ebn0s, bits, rng)
+        throughput = _throughput(run, bits, rng)
+        frameTime = _frameTime(run, 8 * frame_bytes, rng)
+        print(
+            f"{run[0]:<32} {run[1]:>6.3f} {required:>15.2f} dB {throughput / 1e6:>14.2f} {frameTime * 1e3:>16.3f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the EthaNET payload FEC options")
+    parser.add_argument(
+        "--bits",
+        type=int,
+        default=200000,
+        help="Information bits simulated per Eb/N0 point (200000)",
+    )
+    parser.add_argument(
+        "--target_ber",
+        type=float,
+        default=1e-4,
+        help="Bit error rate the required Eb/N0 is reported for (1e-4)",
+    )
+    parser.add_argument(
+        "--frame_bytes",
+        type=int,
+        default=32,
+        help="Payload bytes per convolutional frame, matches the runner.py MTU (32)",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (0)")
+
+    args = parser.parse_args()
+    main(**vars(args))
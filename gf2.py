@@ -0,0 +1,222 @@
+from functools import lru_cache
+
+import numpy as np
+
+
+#################################################################
+##################  BIT-PACKED GF(2) ENGINE  ####################
+#################################################################
+
+# Vectors over GF(2) are stored one row per vector, packed MSB first into
+# uint64 words: bit i of a row is bit (63 - i % 64) of word i // 64. Adding
+# vectors is XOR of words and a dot product is the parity of an AND.
+
+
+def numWords(numBits: int) -> int:
+    return -(-numBits // 64)
+
+
+def packRows(bits: np.ndarray, words: int = None) -> np.ndarray:
+    """Pack a (rows x bits) 0/1 array into (rows x words) uint64 words
+
+    Args:
+        bits (np.ndarray): (rows x bits) matrix of 0s and 1s
+        words (int): words per row, just enough for the bits if None
+
+    Returns:
+        np.ndarray: (rows x words) uint64 matrix
+    """
+    bits = np.atleast_2d(bits)
+    if words is None:
+        words = numWords(bits.shape[1])
+    packed = np.packbits(bits.astype(np.uint8, copy=False), axis=1)
+    rowBytes = np.zeros((bits.shape[0], 8 * words), dtype=np.uint8)
+    rowBytes[:, : packed.shape[1]] = packed
+    return rowBytes.view(">u8").astype(np.uint64)
+
+
+def unpackRows(words: np.ndarray, numBits: int) -> np.ndarray:
+    """Inverse of packRows(), returns a (rows x numBits) uint8 matrix of 0s and 1s"""
+    rowBytes = words.astype(">u8").view(np.uint8).reshape(words.shape[0], -1)
+    return np.unpackbits(rowBytes, axis=1, count=numBits)
+
+
+def parity(words: np.ndarray) -> np.ndarray:
+    """Parity (popcount mod 2) of every uint64 word, as uint64 0s and 1s"""
+    words = words.copy()
+    for shift in (32, 16, 8, 4, 2, 1):
+        words ^= words >> np.uint64(shift)
+    return words & np.uint64(1)
+
+
+def byteTables(rows: np.ndarray) -> np.ndarray:
+    """XOR lookup tables for multiplying byte-packed vectors by a packed matrix
+
+    Entry [j, v] is the XOR of the rows selected by the bits of byte value v
+    at byte position j of the vector, so a product needs one lookup per byte
+    of the vector instead of one row per bit.
+
+    Args:
+        rows (np.ndarray): (numRows x words) packed matrix
+
+    Returns:
+        np.ndarray: (ceil(numRows / 8) x 256 x words) uint64 tables
+    """
+    numBytes = -(-rows.shape[0] // 8)
+    tables = np.zeros((numBytes, 256, rows.shape[1]), dtype=np.uint64)
+    values = np.arange(256)
+    for row in range(rows.shape[0]):
+        j, b = divmod(row, 8)
+        selected = ((values >> (7 - b)) & 1).astype(bool)
+        tables[j, selected] ^= rows[row]
+    return tables
+
+
+def multiplyPacked(vectors: np.ndarray, tables: np.ndarray) -> np.ndarray:
+    """Multiply byte-packed row vectors by the matrix behind byteTables()
+
+    Args:
+        vectors (np.ndarray): (numVectors x numBytes) uint8, packed MSB first as by np.packbits
+        tables (np.ndarray): tables from byteTables()
+
+    Returns:
+        np.ndarray: (numVectors x words) uint64 products
+    """
+    product = np.zeros((vectors.shape[0], tables.shape[2]), dtype=np.uint64)
+    for j in range(tables.shape[0]):
+        product ^= tables[j, vectors[:, j]]
+    return product
+
+
+def syndromes(words: np.ndarray, checkRows: np.ndarray) -> np.ndarray:
+    """Syndromes of packed vectors against packed parity check rows
+
+    Args:
+        words (np.ndarray): (numVectors x words) packed vectors
+        checkRows (np.ndarray): (numChecks x words) packed parity check matrix
+
+    Returns:
+        np.ndarray: (numVectors,) syndromes with check r in bit r
+    """
+    syndrome = np.zeros(words.shape[0], dtype=np.intp)
+    for r, row in enumerate(checkRows):
+        check = np.bitwise_xor.reduce(words & row, axis=1)
+        syndrome |= parity(check).astype(np.intp) << r
+    return syndrome
+
+
+def streamWords(data: np.ndarray, extraWords: int = 1) -> np.ndarray:
+    """Pack a byte stream MSB first into a flat uint64 bit stream
+
+    Args:
+        data (np.ndarray): uint8 bytes
+        extraWords (int): zero words appended, reads up to 64 * (extraWords - 1) bits past the end stay valid
+
+    Returns:
+        np.ndarray: flat uint64 words, see bitFields()
+    """
+    words = numWords(8 * data.size) + extraWords
+    stream = np.zeros(8 * words, dtype=np.uint8)
+    stream[: data.size] = data
+    return stream.view(">u8").astype(np.uint64)
+
+
+def _fieldIndex(starts: np.ndarray) -> tuple:
+    """Word indices and shifts bitFields() reads the fields at starts with"""
+    starts = np.asarray(starts, dtype=np.int64)
+    q = starts >> 6
+    r = (starts & 63).astype(np.uint64)
+    index = (q, q + 1, r, np.uint64(63) - r)
+    for array in index:
+        array.flags.writeable = False  # shared through the plan caches below
+    return index
+
+
+def _readFields(stream: np.ndarray, index: tuple) -> np.ndarray:
+    q, qNext, r, rLow = index
+    # the low part is shifted in two steps so r = 0 never shifts by all 64 bits
+    return (stream[q] << r) | ((stream[qNext] >> np.uint64(1)) >> rLow)
+
+
+def bitFields(stream: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """64 bit fields of a flat bit stream starting at arbitrary bit offsets
+
+    Args:
+        stream (np.ndarray): flat uint64 words, with a word after the last one any field starts in
+        starts (np.ndarray): bit offsets of the fields, any shape
+
+    Returns:
+        np.ndarray: uint64 fields shaped like starts, the bit at each offset in the MSB
+    """
+    return _readFields(stream, _fieldIndex(starts))
+
+
+def _rowMask(rowBits: int, words: int) -> np.ndarray:
+    remaining = np.clip(rowBits - 64 * np.arange(words), 0, 64)
+    return np.array([(2**64 - 1) ^ (2 ** (64 - int(b)) - 1) for b in remaining], dtype=np.uint64)
+
+
+# Frames of a code come in few sizes, so the index arithmetic of splitting
+# and joining rows is planned once per shape and reused.
+
+
+@lru_cache(maxsize=1024)
+def _splitPlan(numRows: int, rowBits: int, words: int) -> tuple:
+    starts = rowBits * np.arange(numRows).reshape(-1, 1) + 64 * np.arange(words)
+    return _fieldIndex(starts), _rowMask(rowBits, words)
+
+
+def splitRows(stream: np.ndarray, numRows: int, rowBits: int, words: int) -> np.ndarray:
+    """Cut a flat bit stream into consecutive packed rows
+
+    Args:
+        stream (np.ndarray): flat uint64 words, see bitFields()
+        numRows (int): rows to cut, row i starts at bit i * rowBits
+        rowBits (int): bits per row, the rest of the row is zeroed
+        words (int): words per row
+
+    Returns:
+        np.ndarray: (numRows x words) packed matrix
+    """
+    index, mask = _splitPlan(numRows, rowBits, words)
+    return _readFields(stream, index) & mask
+
+
+@lru_cache(maxsize=1024)
+def _joinPlan(numRows: int, rowBits: int, words: int, numBytes: int) -> tuple:
+    # a 64 bit output word starting in a row can reach this many rows past it
+    spanRows = -(-63 // rowBits)
+    # built a word at a time, each word starts somewhere in one row
+    row, offset = np.divmod(64 * np.arange(numWords(8 * numBytes)), rowBits)
+    head = _fieldIndex(64 * (words + 1) * row + offset)
+    # and takes the rest from the first word of the rows after it, each shifted
+    # past the bits already filled. Two step shifts turn 64 or more into 0.
+    extra = np.arange(1, spanRows + 1)
+    filled = (rowBits - offset).reshape(-1, 1) + rowBits * (extra - 1)
+    spillWords = (words + 1) * (row.reshape(-1, 1) + extra)
+    spillShifts = (np.minimum(filled, 64) - 1).astype(np.uint64)
+    return numRows + spanRows + 1, head, spillWords, spillShifts
+
+
+def joinRows(rows: np.ndarray, rowBits: int, numBytes: int) -> np.ndarray:
+    """Concatenate the first rowBits bits of every packed row into bytes
+
+    Args:
+        rows (np.ndarray): (rows x words) packed matrix, zero past rowBits
+        rowBits (int): bits per row
+        numBytes (int): bytes of the concatenation to return, the last one zero-filled
+
+    Returns:
+        np.ndarray: (numBytes,) uint8 bytes, MSB first
+    """
+    numRows, words = rows.shape
+    paddedRows, head, spillWords, spillShifts = _joinPlan(numRows, rowBits, words, numBytes)
+    # extra zero words and rows keep every read in bounds
+    padded = np.zeros((paddedRows, words + 1), dtype=np.uint64)
+    padded[:numRows, :words] = rows
+    stream = padded.ravel()
+
+    joined = _readFields(stream, head)
+    spill = (stream[spillWords] >> np.uint64(1)) >> spillShifts
+    joined |= np.bitwise_or.reduce(spill, axis=1)
+    return joined.astype(">u8").view(np.uint8)[:numBytes]
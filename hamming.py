@@ -1,12 +1,19 @@
 import numpy as np
 import sys
 import logging
+import gf2
 
 try:
     import c_code.hamm_cffi as hamm_cffi
 except:
     pass
 
+# Orders supported by the byte framing layer. The pad length is carried in a
+# single byte, so k = 2**order - order - 1 must stay below 256.
+FRAME_ORDERS = range(3, 9)
+
+_PAD_BITS = np.unpackbits(np.frombuffer(b"_", dtype=np.uint8))
+
 
 class _hamming:
 
@@ -19,6 +26,7 @@ class _hamming:
         self.H = self._genH()
         self.G = self._genG()
         self.rate = self.k / self.n
+        self.words = gf2.numWords(self.n)  # uint64 words per packed codeword
         self.CFFI = False
 
         # Use CFFI performance optimization if it is available and wanted
@@ -81,6 +89,10 @@ class _hamming:
 
 
 class encoder(_hamming):
+    def __init__(self, order: int = 3, CFFI: bool = None):
+        _hamming.__init__(self, order, CFFI=CFFI)
+        self.G_tables = gf2.byteTables(gf2.packRows(self.G, self.words))
+
     def encode(self, message: np.ndarray, encoding: str = "bool") -> np.ndarray:
         """Encode messages into codewords
 
@@ -103,9 +115,15 @@ class encoder(_hamming):
                 # log_h.warning(
                 #     f"\tMessage size doesn't fit nicely with hamming codes. Padding with '_' until it does..."
                 # )
-                while message.size % self.k != 0:
-                    # ascii value of '_' = 0x5F
-                    message = np.insert(message, 0, np.array([0, 1, 0, 1, 1, 1, 1, 1]))
+                # whole '_' bytes (ascii 0x5F) are prepended, as few as make the size fit
+                numPad = next(
+                    (n for n in range(self.k) if (message.size + 8 * n) % self.k == 0), None
+                )
+                if numPad is None:
+                    raise ValueError(
+                        f"No number of whole pad bytes fits {message.size} bits to k = {self.k}."
+                    )
+                message = np.concatenate((np.tile(_PAD_BITS, numPad), message.ravel()))
             message = message.reshape(-1, self.k)
 
         # Encoder Tree
@@ -136,11 +154,63 @@ class encoder(_hamming):
         else:
             raise ValueError("Invalid Arguements Entered into encode()")
 
+    def encode_packed(self, message: np.ndarray) -> np.ndarray:
+        """Encode bit-packed messages into bit-packed codewords
+
+        Args:
+            message (np.ndarray): (number of messages x ceil(k/8)) uint8 matrix, rows packed MSB first as by np.packbits
+
+        Returns:
+            np.ndarray: (number of messages x words) uint64 matrix, see gf2 for the layout
+        """
+        message = np.asarray(message, dtype=np.uint8).reshape(-1, self.G_tables.shape[0])
+        return gf2.multiplyPacked(message, self.G_tables)
+
+    def encode_frame(self, data: bytes) -> bytes:
+        """Encode a byte payload into a length-aware FEC frame
+
+        The information bits are laid out as
+
+            [ PAD (8 bits) | DATA (8 * len(data) bits) | FILL (PAD zero bits) ]
+
+        so the frame always fills a whole number of k-bit messages and the
+        decoder knows how much fill to strip. Codewords are packed MSB first
+        and the last byte is zero-filled.
+
+        Args:
+            data (bytes): payload to encode
+
+        Returns:
+            bytes: packed codewords
+        """
+        if self.order not in FRAME_ORDERS:
+            raise ValueError(f"Framing is only supported for orders 3-8 ({self.order}).")
+        data = np.frombuffer(bytes(data), dtype=np.uint8)
+        pad = -8 * (data.size + 1) % self.k
+        numMessages = (8 * (data.size + 1) + pad) // self.k
+        # messages are cut straight out of the packed stream, which is zero past
+        # the data, so the fill needs no separate padding step
+        stream = gf2.streamWords(
+            np.concatenate(([pad], data)).astype(np.uint8), self.words + 1
+        )
+        message = gf2.splitRows(stream, numMessages, self.k, self.words)
+        messageBytes = message.astype(">u8").view(np.uint8).reshape(numMessages, -1)
+        codeword = self.encode_packed(messageBytes[:, : self.G_tables.shape[0]])
+        return gf2.joinRows(codeword, self.n, -(-numMessages * self.n // 8)).tobytes()
+
 
 class decoder(_hamming):
     def __init__(self, order: int = 3, erasure: bool = False, CFFI: bool = None):
         _hamming.__init__(self, order, CFFI=CFFI)
         self.erasure = erasure
+
+        # Syndromes are read with check r in bit r; map each to the packed single bit error it points at
+        self.H_packed = gf2.packRows(self.H, self.words)
+        columnSyndromes = (self.H << np.arange(self.order).reshape(-1, 1)).sum(axis=0)
+        self.errorPatterns = np.zeros((2**self.order, self.words), dtype=np.uint64)
+        self.errorPatterns[columnSyndromes] = gf2.packRows(
+            np.identity(self.n, dtype=np.uint8), self.words
+        )
         if self.erasure:
             self.bipolar_erasure_val = 0
             self.M = np.zeros((2**self.k // 2, self.k), dtype=int)
@@ -205,7 +275,17 @@ class decoder(_hamming):
         # print(f"codeword = \n{codeword}\noutput = \n{output}")
         return codeword
 
-    def decode(self, codeword: np.ndarray) -> np.ndarray:
+    def decode(self, codeword: np.ndarray, stats: bool = False) -> np.ndarray:
+        """Correct and decode codewords into messages
+
+        Args:
+            codeword (np.ndarray): (number of codewords x codeword length) matrix containing row codewords
+            stats (bool): also return the number of bits corrected in each codeword
+
+        Returns:
+            np.ndarray: (number of codewords x message length) matrix containing row messages, and with
+                stats the (number of codewords,) corrected bit counts
+        """
         if type(codeword) != np.ndarray:
             codeword = np.array(codeword, dtype=np.uint8)
         if codeword.dtype is not np.uint8:
@@ -213,6 +293,13 @@ class decoder(_hamming):
         if len(codeword.shape) != 2:
             codeword = codeword.reshape(-1, self.n)
 
+        if stats:
+            if self.erasure:
+                raise ValueError("Correction statistics are not available with erasure decoding")
+            # the packed decoder gets the counts from the syndromes it corrects with
+            message, corrected = self.decode_packed(gf2.packRows(codeword, self.words), stats=True)
+            return np.unpackbits(message, axis=1, count=self.k), corrected
+
         if self.CFFI and not self.erasure:
             numMessages = codeword.shape[0]
             codeword = codeword.flatten()
@@ -229,6 +316,78 @@ class decoder(_hamming):
         else:
             return self._decode_nonerasure(codeword)
 
+    def decode_packed(self, codeword: np.ndarray, stats: bool = False) -> np.ndarray:
+        """Correct and decode bit-packed codewords into bit-packed messages
+
+        Every nonzero syndrome is corrected as a single bit error. Hamming codes
+        are perfect, so no syndrome is left over to flag a block as
+        uncorrectable: heavier errors are miscorrected into another codeword.
+
+        Args:
+            codeword (np.ndarray): (number of codewords x words) uint64 matrix, see gf2 for the layout
+            stats (bool): also return the number of bits corrected in each codeword
+
+        Returns:
+            np.ndarray: (number of codewords x ceil(k/8)) uint8 matrix, rows packed MSB first as by np.packbits,
+                and with stats the (number of codewords,) corrected bit counts
+        """
+        message, syndrome = self._correct_packed(codeword)
+        messageBytes = message.astype(">u8").view(np.uint8).reshape(message.shape[0], -1)
+        messageBytes = messageBytes[:, : -(-self.k // 8)]
+        if stats:
+            return messageBytes, (syndrome != 0).astype(np.intp)
+        return messageBytes
+
+    def _correct_packed(self, codeword: np.ndarray) -> tuple:
+        """Correct packed codewords, returns the packed (number of codewords x words) messages and the syndromes"""
+        codeword = np.asarray(codeword, dtype=np.uint64).reshape(-1, self.words)
+        syndrome = gf2.syndromes(codeword, self.H_packed)
+        corrected = codeword ^ self.errorPatterns[syndrome]
+        # the code is systematic, the message is the codeword shifted past the parity bits
+        shift = np.uint64(self.order)
+        message = corrected << shift
+        message[:, :-1] |= corrected[:, 1:] >> (np.uint64(64) - shift)
+        return message, syndrome
+
+    def decode_frame(self, coded: bytes, stats: bool = False) -> bytes:
+        """Decode a frame created by encoder.encode_frame() back into its payload
+
+        Args:
+            coded (bytes): packed codewords
+            stats (bool): also return the frame's correction statistics
+
+        Returns:
+            bytes: payload with the framing removed, and with stats a dict of the number of
+                "codewords", the bits "corrected" and whether the frame was "uncorrectable",
+                which for Hamming framing means the decoded pad byte does not fit the frame length
+        """
+        if self.order not in FRAME_ORDERS:
+            raise ValueError(f"Framing is only supported for orders 3-8 ({self.order}).")
+        coded = np.frombuffer(bytes(coded), dtype=np.uint8)
+        numCodewords = 8 * coded.size // self.n
+        if numCodewords * self.k < 8:
+            # too short to hold even the pad byte, so it cannot be a valid frame
+            if stats:
+                return b"", {"codewords": 0, "corrected": 0, "uncorrectable": 1}
+            return b""
+        stream = gf2.streamWords(coded, self.words + 1)
+        codeword = gf2.splitRows(stream, numCodewords, self.n, self.words)
+        message, syndrome = self._correct_packed(codeword)
+        infoBits = numCodewords * self.k
+        info = gf2.joinRows(message, self.k, infoBits // 8)
+        pad = int(info[0])
+        # For order 3 the byte fill can hold one extra all-zero codeword. It only
+        # adds k = 4 bits, so the floor division drops it along with the fill.
+        numBytes = max((infoBits - 8 - pad) // 8, 0)
+        payload = info[1 : 1 + numBytes].tobytes()
+        if stats:
+            return payload, {
+                "codewords": numCodewords,
+                "corrected": int(np.count_nonzero(syndrome)),
+                "uncorrectable": int(pad != -8 * (numBytes + 1) % self.k),
+            }
+        return payload
+
     def correct(self, codeword: np.ndarray) -> np.ndarray:
         if type(codeword) != np.ndarray:
             codeword = np.array(codeword, dtype=np.uint8)
@@ -0,0 +1,66 @@
+from collections import defaultdict, deque
+
+import numpy as np
+
+
+class LinkQuality:
+    """Rolling error rates per source and per MCS.
+
+    Every frame handed to record() is kept in a ring of the last `history`
+    frames of its source and of its MCS, so the rates follow the link as it
+    changes. A frame whose source cannot be trusted is kept for its MCS only.
+    """
+
+    def __init__(self, history: int = 256):
+        """
+        Args:
+            history (int): frames kept per source and per MCS
+        """
+        self.history = history
+        self.by_source = defaultdict(self._ring)
+        self.by_mcs = defaultdict(self._ring)
+
+    def _ring(self) -> deque:
+        return deque(maxlen=self.history)
+
+    def record(
+        self, source_addr: int, mcs: int, fec_stats: dict = None, crc_failed: bool = False
+    ):
+        """Add one frame.
+
+        Args:
+            source_addr (int): SRC of the frame, None to count it only towards its MCS
+            mcs (int): MCS of the frame
+            fec_stats (dict): statistics from the decoder's decode_frame(stats=True), None if it was not decoded
+            crc_failed (bool): the frame failed its CRC
+        """
+        if fec_stats is None:
+            fec_stats = {"codewords": 0, "corrected": 0, "uncorrectable": 0}
+        sample = (
+            int(fec_stats["codewords"] > 0),
+            fec_stats["codewords"],
+            fec_stats["corrected"],
+            fec_stats["uncorrectable"],
+            int(crc_failed),
+        )
+        if source_addr is not None:
+            self.by_source[source_addr].append(sample)
+        self.by_mcs[mcs].append(sample)
+
+    def rates(self) -> dict:
+        """Error rates over the kept frames, keyed by "source" and "mcs"."""
+        return {
+            "source": {addr: self._rates(ring) for addr, ring in self.by_source.items()},
+            "mcs": {mcs: self._rates(ring) for mcs, ring in self.by_mcs.items()},
+        }
+
+    @staticmethod
+    def _rates(ring: deque) -> dict:
+        decoded, codewords, corrected, uncorrectable, crc_failed = np.sum(ring, axis=0)
+        return {
+            "frames": len(ring),
+            "decoded": int(decoded),
+            "corrected_per_codeword": float(corrected / max(codewords, 1)),
+            "uncorrectable_rate": float(uncorrectable / max(decoded, 1)),
+            "crc_failure_rate": float(crc_failed / len(ring)),
+        }
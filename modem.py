@@ -0,0 +1,563 @@
+import argparse
+import logging
+import threading
+import time
+import numpy as np
+
+try:
+    import pmt
+    import zmq
+except ImportError:
+    pass
+
+
+# ---------------------------------------------------------------------------------------------- #
+# |                        |                        |                                          | #
+# |        PREAMBLE        |         HEADER         |                 PAYLOAD                  | #
+# |  63 BPSK symbols (PN)  |    48 BPSK symbols     |     LEN bytes, constellation by MCS      | #
+# ---------------------------------------------------------------------------------------------- #
+
+
+# Headless NumPy version of the PHY in EthaNET.grc, for loopback runs without
+# GNU Radio or SDR hardware. The flowgraph has no packet sync yet, so a PN
+# preamble is added in front of every burst for detection, timing and
+# carrier recovery.
+
+logging.basicConfig()
+logger = logging.getLogger("modem")
+
+# flowgraph variables
+SAMP_RATE = 1e6
+SPS = 4
+ALPHA = 0.9  # rcc_taps and FLL rolloff
+NFILTS = 32
+TX_ALPHA = 0.5  # pdu_modulator rolloff
+TX_SPAN = 12  # pdu_modulator span in symbols
+TX_GAIN = 0.4  # keeps the signal within +-1 at the sink
+
+# Points in symbol index order, like the flowgraph's constellation (bpsk) and
+# constellation1 (qpsk) variables with amplitude normalization
+CONSTELLATIONS = {
+    "bpsk": np.array([-1, 1], dtype=np.complex64),
+    "qpsk": np.array([-1 - 1j, 1 - 1j, -1 + 1j, 1 + 1j], dtype=np.complex64) / np.sqrt(2),
+}
+# The flowgraph's payload selector is indexed by MCS. MCS values it has no input for use BPSK.
+MCS_CONSTELLATIONS = {0: "bpsk", 1: "qpsk"}
+
+HEADER_BYTES = 6
+TRACKING_BLOCK = 32  # symbols per carrier phase update
+TRACKING_GAIN = 0.1
+# Noise alone peaks near 0.57 over 400k samples and real bursts clear 0.8 down to about -3 dB SNR
+DETECTION_THRESHOLD = 0.75
+PREAMBLE_SEGMENTS = 7  # correlated non-coherently so frequency offset does not wipe out the peak
+
+
+def rootRaisedCosine(gain: float, sampling_freq: float, symbol_rate: float, alpha: float, ntaps: int) -> np.ndarray:
+    """Root raised cosine taps, computed the same way as GNU Radio's firdes.root_raised_cosine()"""
+    ntaps |= 1
+    spb = sampling_freq / symbol_rate
+    taps = np.zeros(ntaps)
+    for i in range(ntaps):
+        xindx = i - ntaps // 2
+        x1 = np.pi * xindx / spb
+        x2 = 4 * alpha * xindx / spb
+        x3 = x2 * x2 - 1
+        if abs(x3) >= 0.000001:
+            if i != ntaps // 2:
+                num = np.cos((1 + alpha) * x1) + np.sin((1 - alpha) * x1) / (4 * alpha * xindx / spb)
+            else:
+                num = np.cos((1 + alpha) * x1) + (1 - alpha) * np.pi / (4 * alpha)
+            den = x3 * np.pi
+        else:
+            if alpha == 1:
+                taps[i] = -1
+                continue
+            x3 = (1 - alpha) * x1
+            x2 = (1 + alpha) * x1
+            num = (
+                np.sin(x2) * (1 + alpha) * np.pi
+                - np.cos(x3) * ((1 - alpha) * np.pi * spb) / (4 * alpha * xindx)
+                + np.sin(x3) * spb * spb / (4 * alpha * xindx * xindx)
+            )
+            den = -32 * np.pi * alpha * alpha * xindx / spb
+        taps[i] = 4 * alpha * num / den
+    return taps * gain / taps.sum()
+
+
+def _pnSequence(degree: int = 6, taps=(6, 5)) -> np.ndarray:
+    """Maximal length LFSR sequence as 0/1 bits"""
+    state = [1] * degree
+    bits = []
+    for _ in range(2**degree - 1):
+        bits.append(state[-1])
+        feedback = 0
+        for t in taps:
+            feedback ^= state[t - 1]
+        state = [feedback] + state[:-1]
+    return np.array(bits, dtype=np.uint8)
+
+
+PREAMBLE_BITS = _pnSequence()
+
+
+def _fftConvolve(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Full linear convolution of every row of a with b"""
+    size = a.shape[-1] + b.size - 1
+    nfft = 1 << (size - 1).bit_length()
+    out = np.fft.ifft(np.fft.fft(a, nfft) * np.fft.fft(b, nfft), nfft)
+    return out[..., :size]
+
+
+def _nearest(symbols: np.ndarray, points: np.ndarray) -> np.ndarray:
+    return np.argmin(np.abs(symbols[:, None] - points[None, :]), axis=1)
+
+
+def bytesToSymbols(data: bytes, constellation: str) -> np.ndarray:
+    """Map bytes to constellation points MSB first, like the flowgraph's pdu_modulator"""
+    points = CONSTELLATIONS[constellation]
+    bitsPerSymbol = int(np.log2(points.size))
+    bits = np.unpackbits(np.frombuffer(bytes(data), dtype=np.uint8))
+    bits = np.pad(bits, (0, -bits.size % bitsPerSymbol)).reshape(-1, bitsPerSymbol)
+    return points[bits @ (1 << np.arange(bitsPerSymbol - 1, -1, -1))]
+
+
+def symbolsToBytes(indices: np.ndarray, constellation: str) -> bytes:
+    bitsPerSymbol = int(np.log2(CONSTELLATIONS[constellation].size))
+    bits = (indices[:, None] >> np.arange(bitsPerSymbol - 1, -1, -1)) & 1
+    return np.packbits(bits.astype(np.uint8).ravel()).tobytes()
+
+
+class modulator:
+    def __init__(self, sps: int = SPS, alpha: float = TX_ALPHA, span: int = TX_SPAN, gain: float = TX_GAIN):
+        self.sps = sps
+        self.span = span
+        self.gain = gain
+        self.taps = rootRaisedCosine(sps, sps, 1.0, alpha, span * sps)
+        self.preamble = CONSTELLATIONS["bpsk"][PREAMBLE_BITS]
+
+    def symbols(self, pdu: bytes) -> np.ndarray:
+        """Preamble, BPSK header and payload in the constellation its MCS selects"""
+        constellation = MCS_CONSTELLATIONS.get(pdu[0], "bpsk")
+        return np.concatenate(
+            (
+                self.preamble,
+                bytesToSymbols(pdu[:HEADER_BYTES], "bpsk"),
+                bytesToSymbols(pdu[HEADER_BYTES:], constellation),
+            )
+        )
+
+    def modulate(self, pdus: list) -> list:
+        """Pulse shape a batch of raw EthaNET frames into bursts of samples
+
+        All bursts are filtered together as one zero-padded block.
+
+        Args:
+            pdus (list): frames, header and coded payload
+
+        Returns:
+            list: complex64 sample array per frame
+        """
+        symbols = [self.symbols(pdu) for pdu in pdus]
+        lengths = [s.size for s in symbols]
+        upsampled = np.zeros((len(pdus), max(lengths) * self.sps), dtype=np.complex64)
+        for row, s in enumerate(symbols):
+            upsampled[row, : s.size * self.sps : self.sps] = s
+        shaped = _fftConvolve(upsampled, self.taps) * self.gain
+
+        # drop the filter transients like the flowgraph's pdu_modulator does
+        trim = self.sps * self.span // 2
+        return [
+            shaped[row, trim : n * self.sps + self.taps.size - 1 - trim].astype(np.complex64)
+            for row, n in enumerate(lengths)
+        ]
+
+
+def channel(
+    samples: np.ndarray,
+    snr_db: float = None,
+    freq_offset: float = 0.0,
+    delay: float = 0,
+    samp_rate: float = SAMP_RATE,
+    rng=None,
+) -> np.ndarray:
+    """Delay, frequency offset and AWGN
+
+    Args:
+        samples (np.ndarray): transmitted samples
+        snr_db (float): average signal to noise power per sample, no noise if None
+        freq_offset (float): carrier frequency offset in Hz
+        delay (float): samples of silence before and after the signal, fractions shift the signal between samples
+        samp_rate (float): sample rate in Hz
+        rng (np.random.Generator): noise source
+
+    Returns:
+        np.ndarray: received samples
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    signalPower = np.mean(np.abs(samples) ** 2)
+    whole = int(np.ceil(delay))
+    samples = np.concatenate((np.zeros(whole), samples, np.zeros(whole))).astype(np.complex64)
+    if whole != delay:
+        frequencies = np.fft.fftfreq(samples.size)
+        spectrum = np.fft.fft(samples) * np.exp(2j * np.pi * frequencies * (whole - delay))
+        samples = np.fft.ifft(spectrum).astype(np.complex64)
+    samples *= np.exp(2j * np.pi * freq_offset / samp_rate * np.arange(samples.size))
+    if snr_db is not None:
+        sigma = np.sqrt(signalPower / 10 ** (snr_db / 10) / 2)
+        samples += sigma * (rng.standard_normal(samples.size) + 1j * rng.standard_normal(samples.size))
+    return samples.astype(np.complex64)
+
+
+class demodulator:
+    def __init__(self, sps: int = SPS, alpha: float = ALPHA, nfilts: int = NFILTS, samp_rate: float = SAMP_RATE):
+        self.sps = sps
+        self.nfilts = nfilts
+        self.samp_rate = samp_rate
+        # polyphase matched filter, the rcc_taps of the flowgraph's symbol sync
+        prototype = rootRaisedCosine(nfilts, nfilts * samp_rate, samp_rate / sps, alpha, 11 * sps * nfilts)
+        prototype = np.pad(prototype, (0, -prototype.size % nfilts))
+        self.arms = prototype.reshape(-1, nfilts).T
+
+        self.preamble = CONSTELLATIONS["bpsk"][PREAMBLE_BITS].real
+        self.segments = np.array_split(np.arange(self.preamble.size), PREAMBLE_SEGMENTS)
+
+    def _detect(self, filtered: np.ndarray) -> np.ndarray:
+        """Normalized preamble metric in [0, 1] for a burst starting at each sample"""
+        span = (self.preamble.size - 1) * self.sps + 1
+        if filtered.size < span:
+            return np.zeros(0)
+        size = filtered.size - span + 1
+        metric = np.zeros(size)
+        for segment in self.segments:
+            reference = np.zeros(span)
+            reference[segment * self.sps] = self.preamble[segment]
+            metric += np.abs(_fftConvolve(filtered, reference[::-1])[span - 1 : span - 1 + size])
+        window = np.zeros(span)
+        window[:: self.sps] = 1
+        energy = _fftConvolve(np.abs(filtered) ** 2, window)[span - 1 : span - 1 + size].real
+        return metric / np.sqrt(self.preamble.size * np.maximum(energy, 1e-12))
+
+    def _coarseFrequency(self, samples: np.ndarray) -> float:
+        """Frequency offset in cycles per sample for the whole block, standing in for the flowgraph's FLL
+
+        Squaring strips the BPSK preamble and header down to a tone at twice the offset.
+        """
+        squared = np.convolve(samples, self.arms[0]) ** 2
+        nfft = 1 << (4 * squared.size - 1).bit_length()
+        spectrum = np.abs(np.fft.fft(squared, nfft))
+        return np.fft.fftfreq(nfft)[np.argmax(spectrum)] / 2
+
+    def _filter(self, samples: np.ndarray, arm: int) -> np.ndarray:
+        return np.convolve(samples, self.arms[arm])
+
+    def _track(self, symbols: np.ndarray, points: np.ndarray, phase: float, freq: float) -> tuple:
+        """Block decision-directed carrier tracking, a Costas loop updated once per block
+
+        Returns:
+            tuple: symbol indices, phase and frequency (rad/symbol) at the end
+        """
+        indices = np.zeros(symbols.size, dtype=np.intp)
+        for start in range(0, symbols.size, TRACKING_BLOCK):
+            block = symbols[start : start + TRACKING_BLOCK]
+            n = np.arange(block.size)
+            derotated = block * np.exp(-1j * (phase + freq * n))
+            error = np.angle(np.sum(derotated * np.conj(points[_nearest(derotated, points)])))
+            indices[start : start + block.size] = _nearest(derotated * np.exp(-1j * error), points)
+            phase += freq * block.size + error
+            freq += TRACKING_GAIN * error / block.size
+        return indices, phase, freq
+
+    def demodulate(self, samples: np.ndarray) -> list:
+        """Find and demodulate every burst in a block of samples
+
+        Args:
+            samples (np.ndarray): received complex samples
+
+        Returns:
+            list: raw EthaNET frames (header and coded payload), one per burst
+        """
+        samples = np.asarray(samples, dtype=np.complex64)
+        # AGC: the whole block is brought to unit average power at once
+        power = np.mean(np.abs(samples) ** 2)
+        if power == 0:
+            return []
+        samples = samples / np.sqrt(power)
+        samples = samples * np.exp(-2j * np.pi * self._coarseFrequency(samples) * np.arange(samples.size))
+
+        filtered = self._filter(samples, 0)
+        metric = self._detect(filtered)
+        frames = []
+        position = 0
+        while True:
+            candidates = np.flatnonzero(metric[position:] > DETECTION_THRESHOLD)
+            if candidates.size == 0:
+                break
+            # the peak is within a symbol of the first crossing
+            first = position + candidates[0]
+            peak = first + int(np.argmax(metric[first : first + 2 * self.sps]))
+            frame, resume = self._demodulateBurst(samples, metric, peak)
+            if frame is not None:
+                frames.append(frame)
+            position = max(resume, peak + 1)
+        return frames
+
+    def _demodulateBurst(self, samples: np.ndarray, metric: np.ndarray, peak: int) -> tuple:
+        # fractional timing from a parabola through the metric peak, then pick the matched filter arm
+        delta = 0.0
+        if 0 < peak < metric.size - 1:
+            left, centre, right = metric[peak - 1 : peak + 2]
+            curvature = left - 2 * centre + right
+            if curvature < 0:
+                delta = 0.5 * (left - right) / curvature
+        timing = peak + delta
+        start = int(np.floor(timing))
+        arm = int(round((timing - start) * self.nfilts))
+        if arm == self.nfilts:
+            start, arm = start + 1, 0
+
+        filtered = self._filter(samples, arm)
+        preamble = filtered[start : start + self.preamble.size * self.sps : self.sps]
+
+        # frequency offset from the phase step between preamble symbols, removed before refiltering
+        step = np.angle(np.sum(preamble[1:] * np.conj(preamble[:-1]) * self.preamble[1:] * self.preamble[:-1]))
+        samples = samples * np.exp(-1j * step / self.sps * np.arange(samples.size)).astype(np.complex64)
+        filtered = self._filter(samples, arm)
+        preamble = filtered[start : start + self.preamble.size * self.sps : self.sps]
+        phase = np.angle(np.sum(preamble * self.preamble))
+
+        # header: the start of a symbol stream that runs to the end of the block
+        symbols = filtered[start + self.preamble.size * self.sps :: self.sps]
+        # The search resumes after the preamble, not after the burst. A false detection
+        # can decode a garbage LEN, and skipping that far could hide a real burst. The
+        # payload of a real burst correlates no better with the preamble than noise does.
+        preambleEnd = start + self.preamble.size * self.sps
+        headerSymbols = HEADER_BYTES * 8
+        if symbols.size < headerSymbols:
+            return None, preambleEnd
+        indices, phase, freq = self._track(
+            symbols[:headerSymbols], CONSTELLATIONS["bpsk"], phase, 0.0
+        )
+        header = symbolsToBytes(indices, "bpsk")
+
+        constellation = MCS_CONSTELLATIONS.get(header[0], "bpsk")
+        points = CONSTELLATIONS[constellation]
+        payloadSymbols = -(-header[1] * 8 // int(np.log2(points.size)))
+        if symbols.size < headerSymbols + payloadSymbols:
+            logger.debug("Burst runs past the end of the block")
+            return None, preambleEnd
+        indices, phase, freq = self._track(
+            symbols[headerSymbols : headerSymbols + payloadSymbols], points, phase, freq
+        )
+        payload = symbolsToBytes(indices, constellation)[: header[1]]
+        return header + payload, preambleEnd
+
+
+class bridge:
+    """Stands in for the flowgraph between EthaNET nodes over the same ZMQ PDU interface
+
+    PDUs published by the nodes are modulated, passed through the channel and
+    demodulated, and every recovered frame is published back to all nodes as
+    on a shared channel.
+    """
+
+    def __init__(
+        self,
+        node_addrs: list,
+        channel_addr: str = "tcp://*:5556",
+        snr_db: float = None,
+        freq_offset: float = 0.0,
+        max_batch: int = 16,
+        seed: int = None,
+    ):
+        self.modulator = modulator()
+        self.demodulator = demodulator()
+        self.snr_db = snr_db
+        self.freq_offset = freq_offset
+        self.max_batch = max_batch
+        self.rng = np.random.default_rng(seed)
+
+        self.context = zmq.Context()
+        self.recv_socket = self.context.socket(zmq.SUB)
+        for addr in node_addrs:
+            self.recv_socket.connect(addr)
+        self.recv_socket.setsockopt(zmq.SUBSCRIBE, b"")
+        self.send_socket = self.context.socket(zmq.PUB)
+        self.send_socket.bind(channel_addr)
+
+        self.frames_in = 0
+        self.frames_out = 0
+        self.bytes_out = 0
+        self.latency_ms = []  # arrival to publish, per batch
+
+    def _receiveBatch(self, timeout: int) -> list:
+        if not self.recv_socket.poll(timeout):
+            return []
+        batch = []
+        while len(batch) < self.max_batch:
+            try:
+                pdu = pmt.deserialize_str(self.recv_socket.recv(zmq.NOBLOCK))
+            except zmq.Again:
+                break
+            if pmt.is_pair(pdu):
+                pdu = pmt.cdr(pdu)
+            batch.append(bytes(pmt.u8vector_elements(pdu)))
+        return batch
+
+    def step(self, timeout: int = 10) -> int:
+        """Carry one batch of PDUs across the channel, returns the number of PDUs taken in"""
+        batch = self._receiveBatch(timeout)
+        if not batch:
+            return 0
+        arrival = time.perf_counter()
+
+        # bursts go out back to back with a random gap, received as one block of samples
+        samples = np.concatenate(
+            [
+                channel(
+                    burst,
+                    self.snr_db,
+                    self.freq_offset,
+                    self.rng.uniform(4 * SPS, 64 * SPS),
+                    rng=self.rng,
+                )
+                for burst in self.modulator.modulate(batch)
+            ]
+        )
+        frames = self.demodulator.demodulate(samples)
+        for frame in frames:
+            pdu = pmt.cons(pmt.PMT_NIL, pmt.init_u8vector(len(frame), list(frame)))
+            self.send_socket.send(pmt.serialize_str(pdu))
+
+        self.latency_ms.append((time.perf_counter() - arrival) * 1e3)
+        self.frames_in += len(batch)
+        self.frames_out += len(frames)
+        self.bytes_out += sum(len(frame) for frame in frames)
+        logger.debug(f"Carried {len(frames)}/{len(batch)} frames in {self.latency_ms[-1]:.1f} ms")
+        return len(batch)
+
+    def run(self, stop: threading.Event = None):
+        while stop is None or not stop.is_set():
+            self.step()
+
+
+def loopback(num_messages: int, mtu: int, mcs_level: int, snr_db: float, freq_offset: float, base_port: int = 5570):
+    """Send messages between two EthaNET nodes through the headless modem and time them
+
+    Returns:
+        dict: delivered messages and bytes, bytes per second and latency percentiles
+    """
+    from ethaNET import EthaNET
+
+    addrs = [f"tcp://127.0.0.1:{base_port + i}" for i in range(3)]
+    sender = EthaNET(source_addr=1, grc_send_addr=addrs[0], grc_recv_addr=addrs[2], ack_timeout=1000)
+    receiver = EthaNET(source_addr=2, grc_send_addr=addrs[1], grc_recv_addr=addrs[2], ack_timeout=1000)
+    phy = bridge(addrs[:2], addrs[2], snr_db, freq_offset)
+    stop = threading.Event()
+    threading.Thread(target=phy.run, args=(stop,), daemon=True).start()
+    time.sleep(0.5)  # let the ZMQ subscriptions settle
+
+    sent = {}
+    latencies = []
+    delivered = 0
+
+    def receive():
+        nonlocal delivered
+        while not stop.is_set():
+            packet = receiver.receive(100)
+            if packet is None or packet.source_addr != 1:
+                continue
+            index = int.from_bytes(packet.payload[:4], "big")
+            if index in sent:
+                latencies.append((time.perf_counter() - sent[index]) * 1e3)
+                delivered += len(packet.payload)
+
+    listener = threading.Thread(target=receive, daemon=True)
+    listener.start()
+
+    start = time.perf_counter()
+    for index in range(num_messages):
+        message = index.to_bytes(4, "big") + bytes(max(mtu - 4, 0))
+        sent[index] = time.perf_counter()
+        sender.send_async(message, 2, mcs_level)
+    sender.flush()
+    time.sleep(0.2)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    listener.join()
+    sender.close()
+    receiver.close()
+
+    stats = {"messages": len(latencies), "bytes": delivered, "bytes_per_s": delivered / elapsed}
+    if latencies:
+        stats.update(zip(("latency_p50_ms", "latency_p99_ms"), np.percentile(latencies, [50, 99])))
+    return stats
+
+
+def main(verbose, mode, **kwargs):
+    logger.setLevel(verbose)
+    if mode == "bridge":
+        phy = bridge(
+            kwargs["node_addr"], kwargs["channel_addr"], kwargs["snr"], kwargs["offset"]
+        )
+        try:
+            phy.run()
+        except KeyboardInterrupt:
+            logger.info("\nExiting...")
+        logger.info(
+            f"Carried {phy.frames_out}/{phy.frames_in} frames, {phy.bytes_out} bytes"
+        )
+    else:
+        stats = loopback(
+            kwargs["num_messages"], kwargs["mtu"], kwargs["mcs_level"], kwargs["snr"], kwargs["offset"]
+        )
+        print(", ".join(f"{k}: {v:.1f}" if isinstance(v, float) else f"{k}: {v}" for k, v in stats.items()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless NumPy baseband modem for EthaNET")
+    parser.add_argument(
+        "--verbose",
+        "-v",
+        action="count",
+        default=1,
+        help="Sets verbosity level. The more added the higher the verbosity. -vv is the highest and will print debug statements",
+    )
+    parser.add_argument(
+        "--snr",
+        type=float,
+        default=None,
+        help="Channel signal to noise ratio per sample in dB (no noise)",
+    )
+    parser.add_argument(
+        "--offset",
+        type=float,
+        default=0.0,
+        help="Channel carrier frequency offset in Hz (0)",
+    )
+    subparsers = parser.add_subparsers(title="mode", dest="mode", required=True)
+
+    bridge_parser = subparsers.add_parser("bridge", help="Run in place of the flowgraph")
+    bridge_parser.add_argument(
+        "--node_addr",
+        action="append",
+        default=None,
+        help="ZMQ address an EthaNET node transmits on, repeat for every node (tcp://127.0.0.1:5555)",
+    )
+    bridge_parser.add_argument(
+        "--channel_addr",
+        type=str,
+        default="tcp://*:5556",
+        help="ZMQ address the nodes receive from",
+    )
+
+    bench_parser = subparsers.add_parser("bench", help="Time a transfer between two nodes through the modem")
+    bench_parser.add_argument("-n", "--num_messages", type=int, default=100)
+    bench_parser.add_argument("--mtu", type=int, default=32, help="Message size (32)")
+    bench_parser.add_argument("-m", "--mcs_level", type=int, default=0, help="MCS of the messages (0)")
+
+    args = parser.parse_args()
+    if args.mode == "bridge" and args.node_addr is None:
+        args.node_addr = ["tcp://127.0.0.1:5555"]
+    args.verbose = 40 - (10 * args.verbose) if args.verbose > 0 else 0
+    main(**vars(args))
@@ -2,7 +2,9 @@ import argparse
 import json
 import logging
 import sys
+from capture import CaptureWriter
 from ethaNET import EthaNET
+from scheduler import NUM_PRIORITIES, PRIORITY_DATA
 
 
 # ---------------------------------------------------------------------------------------------- #
@@ -16,7 +18,7 @@ logging.basicConfig()
 logger = logging.getLogger()
 
 
-def send(ethan: EthaNET, input_file, mtu, mcs_level, destination_addr):
+def send(ethan: EthaNET, input_file, mtu, mcs_level, destination_addr, priority):
     try:
         while True:
             # Read data from file
@@ -32,12 +34,14 @@ def send(ethan: EthaNET, input_file, mtu, mcs_level, destination_addr):
                 break
 
             logger.info(f"Sending data: {data}")
-            ethan.send(data, destination_addr, mcs_level)
+            # queued without waiting for the ACK, the receive thread retransmits lost frames
+            ethan.send_async(data, destination_addr, mcs_level, priority)
 
+        ethan.flush()
     except KeyboardInterrupt:
         logger.info("\nExiting...")
         return
-    logger.info(f"Done sending from {input_file.name}")
+    logger.info(f"Done sending from {input_file.name}: {dict(ethan.tx_stats)}")
 
 
 # TODO
@@ -57,17 +61,26 @@ def receive(ethan: EthaNET, num_bytes, output_file):
         return
 
 
-def main(verbose, address, grc_transmit_addr, grc_receive_addr, func, **kwargs):
+def main(
+    verbose, address, grc_transmit_addr, grc_receive_addr, capture, func, **kwargs
+):
     logger.setLevel(verbose)
     logger.debug(
         f"Creating EthaNet object with {address} addr, {grc_transmit_addr} grc_trans_addr, and {grc_receive_addr} grc_receive_addr"
     )
+    capture_writer = CaptureWriter(capture) if capture is not None else None
     ethan = EthaNET(
         source_addr=address,
         grc_send_addr=grc_transmit_addr,
         grc_recv_addr=grc_receive_addr,
+        capture=capture_writer,
     )
-    func(ethan, **kwargs)
+    try:
+        func(ethan, **kwargs)
+    finally:
+        ethan.close()
+        if capture_writer is not None:
+            capture_writer.close()
 
 
 if __name__ == "__main__":
@@ -99,6 +112,12 @@ if __name__ == "__main__":
         default="tcp://127.0.0.1:5556",
         help="Address of ZMQ socket of gnuradio receive flow",
     )
+    parser.add_argument(
+        "--capture",
+        type=str,
+        default=None,
+        help="Append every PDU sent or received to this capture file, replay it with capture.py",
+    )
     subparsers = parser.add_subparsers(title="mode", required=True)
 
     sender_parser = subparsers.add_parser("send", aliases=["s"])
@@ -121,7 +140,7 @@ if __name__ == "__main__":
         "--mcs_level",
         type=int,
         default=0,
-        help="Rate at which to send the message (0) [0-255]",
+        help="Rate at which to send the message, 0-5 select Hamming orders 3-8 and 6-9 a convolutional code at rates 1/2, 2/3, 3/4 and 5/6 (0) [0-9]",
     )
     sender_parser.add_argument(
         "--destination_addr",
@@ -130,6 +149,14 @@ if __name__ == "__main__":
         default=0,
         help="address of node this node is attempting to send info to",
     )
+    sender_parser.add_argument(
+        "-p",
+        "--priority",
+        type=int,
+        default=PRIORITY_DATA,
+        choices=range(NUM_PRIORITIES),
+        help=f"Transmit priority class, lower is sent first ({PRIORITY_DATA}) [0-{NUM_PRIORITIES - 1}]",
+    )
 
     receiver_parser = subparsers.add_parser("receive", aliases=["r"])
     receiver_parser.set_defaults(func=receive)
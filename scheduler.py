@@ -0,0 +1,205 @@
+import logging
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+
+import numpy as np
+
+logging.basicConfig()
+logger = logging.getLogger("scheduler")
+
+# priority classes, lower is served first. ACKs have their own queue ahead of all of them.
+PRIORITY_CONTROL = 0
+PRIORITY_DATA = 1
+PRIORITY_BULK = 2
+NUM_PRIORITIES = 3
+
+# what to do with a PDU when its flow queue is full
+POLICY_DROP = "drop"
+POLICY_BLOCK = "block"
+
+
+class _PriorityClass:
+    """Per destination flow queues of one priority class, served by deficit round-robin."""
+
+    def __init__(self):
+        self.flows = OrderedDict()  # dest -> deque of (pdu, enqueue time)
+        self.deficits = {}
+        self.active = deque()  # dests with queued PDUs, in service order
+        self.size = 0
+
+    def push(self, dest_addr: int, item: tuple):
+        if dest_addr not in self.flows:
+            self.flows[dest_addr] = deque()
+            self.deficits[dest_addr] = 0
+        flow = self.flows[dest_addr]
+        if not flow:
+            self.active.append(dest_addr)
+        flow.append(item)
+        self.size += 1
+
+    def pop(self, quantum: int) -> tuple:
+        while True:
+            dest_addr = self.active[0]
+            flow = self.flows[dest_addr]
+            if self.deficits[dest_addr] < len(flow[0][0]):
+                # out of credit, top up and let the next flow go
+                self.deficits[dest_addr] += quantum
+                self.active.rotate(-1)
+                continue
+            item = flow.popleft()
+            self.deficits[dest_addr] -= len(item[0])
+            if not flow:
+                # an idle flow does not bank credit
+                self.active.popleft()
+                self.deficits[dest_addr] = 0
+            self.size -= 1
+            return item
+
+    def queue_len(self, dest_addr: int) -> int:
+        flow = self.flows.get(dest_addr)
+        return len(flow) if flow is not None else 0
+
+
+class TxScheduler:
+    """Priority transmit scheduler feeding a single sender loop.
+
+    ACKs always go first, then the priority classes in order. Within a class
+    every destination has its own bounded queue and the queues share the link
+    by deficit round-robin, so one large transfer cannot starve the others.
+    """
+
+    def __init__(
+        self,
+        transmit,
+        quantum: int = 512,
+        max_queue_len: int = 64,
+        policy: str = POLICY_BLOCK,
+        latency_history: int = 1024,
+    ):
+        """
+        Args:
+            transmit (callable): called with each PDU from the sender loop, the only place the socket is used
+            quantum (int): bytes of credit a flow gets per round, at least the largest PDU
+            max_queue_len (int): PDUs per flow queue
+            policy (str): POLICY_DROP drops PDUs for a full queue, POLICY_BLOCK makes enqueue() wait
+            latency_history (int): queue latency samples kept per class
+        """
+        if policy not in (POLICY_DROP, POLICY_BLOCK):
+            raise ValueError(f"Policy must be '{POLICY_DROP}' or '{POLICY_BLOCK}' ({policy}).")
+        self.transmit = transmit
+        self.quantum = quantum
+        self.max_queue_len = max_queue_len
+        self.policy = policy
+
+        self._acks = deque()
+        self._classes = [_PriorityClass() for _ in range(NUM_PRIORITIES)]
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+
+        # queue latency in microseconds per class, "ack" for the ACK queue
+        self.latency = {
+            name: deque(maxlen=latency_history)
+            for name in ["ack"] + list(range(NUM_PRIORITIES))
+        }
+        self.dropped = Counter()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="TxScheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def enqueue_ack(self, pdu: bytes):
+        """Queue an ACK ahead of everything else. ACKs are never dropped."""
+        with self._cond:
+            self._acks.append((pdu, time.perf_counter_ns()))
+            self._cond.notify_all()
+
+    def enqueue(
+        self,
+        pdu: bytes,
+        dest_addr: int,
+        priority: int = PRIORITY_DATA,
+        timeout: float = None,
+    ) -> bool:
+        """Queue a PDU on its destination's flow in a priority class.
+
+        Args:
+            pdu (bytes): serialized PDU
+            dest_addr (int): destination, selects the flow queue
+            priority (int): one of the PRIORITY_* classes
+            timeout (float): seconds to wait for room under POLICY_BLOCK, forever if None
+
+        Returns:
+            bool: True if queued, False if dropped or timed out
+        """
+        if not 0 <= priority < NUM_PRIORITIES:
+            raise ValueError(f"Priority must be in [0, {NUM_PRIORITIES}) ({priority}).")
+        cls = self._classes[priority]
+        with self._cond:
+            if cls.queue_len(dest_addr) >= self.max_queue_len:
+                if self.policy == POLICY_DROP or not self._cond.wait_for(
+                    lambda: cls.queue_len(dest_addr) < self.max_queue_len, timeout
+                ):
+                    self.dropped[priority] += 1
+                    logger.debug(f"Queue for {dest_addr} at priority {priority} full! Dropping PDU")
+                    return False
+            cls.push(dest_addr, (pdu, time.perf_counter_ns()))
+            self._cond.notify_all()
+        return True
+
+    def latency_us(self) -> dict:
+        """Queue latency percentiles in microseconds per class."""
+        # the sender loop appends under the condition, so copy the samples under it too
+        with self._cond:
+            snapshot = {name: list(samples) for name, samples in self.latency.items()}
+        stats = {}
+        for name, samples in snapshot.items():
+            if not samples:
+                continue
+            samples = np.array(samples, dtype=float)
+            p50, p99 = np.percentile(samples, [50, 99])
+            stats[name] = {
+                "count": samples.size,
+                "p50": float(p50),
+                "p99": float(p99),
+                "max": float(samples.max()),
+            }
+        return stats
+
+    def _next(self) -> tuple:
+        """Pop the next PDU to send. Must hold the condition with something queued."""
+        if self._acks:
+            return "ack", self._acks.popleft()
+        for priority, cls in enumerate(self._classes):
+            if cls.size:
+                return priority, cls.pop(self.quantum)
+
+    def _pending(self) -> bool:
+        return bool(self._acks) or any(cls.size for cls in self._classes)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending() or not self._running)
+                if not self._running:
+                    return
+                name, (pdu, enqueue_time) = self._next()
+                self.latency[name].append((time.perf_counter_ns() - enqueue_time) / 1000)
+                # wake anyone blocked on a full queue
+                self._cond.notify_all()
+            try:
+                self.transmit(pdu)
+            except Exception:
+                logger.exception("Transmit failed")
@@ -0,0 +1,50 @@
+import pytest
+
+from capture import CAPTURE_MAGIC, CAPTURE_RX, CAPTURE_TX, CaptureReader, CaptureWriter
+
+RECORDS = [
+    (1.5, CAPTURE_RX, b"first"),
+    (2.25, CAPTURE_TX, b""),
+    (3.0, CAPTURE_RX, bytes(range(256)) * 4),
+]
+
+
+@pytest.fixture
+def capture_file(tmp_path):
+    filename = str(tmp_path / "test.ethcap")
+    with CaptureWriter(filename) as writer:
+        for timestamp, direction, pdu in RECORDS:
+            writer.write(direction, pdu, timestamp)
+    return filename
+
+
+def test_round_trip(capture_file):
+    with CaptureReader(capture_file) as reader:
+        assert list(reader) == RECORDS
+
+
+def test_append_keeps_one_header(capture_file):
+    with CaptureWriter(capture_file) as writer:
+        writer.write(CAPTURE_TX, b"appended", 4.0)
+    with CaptureReader(capture_file) as reader:
+        assert list(reader) == RECORDS + [(4.0, CAPTURE_TX, b"appended")]
+
+
+# cut into the PDU, or into the record header itself
+@pytest.mark.parametrize("cut", [1, 1000, len(RECORDS[-1][2]) + 5])
+def test_truncated_last_record_is_dropped(capture_file, cut):
+    with open(capture_file, "r+b") as file:
+        file.seek(0, 2)
+        file.truncate(file.tell() - cut)
+    with CaptureReader(capture_file) as reader:
+        assert list(reader) == RECORDS[:-1]
+
+
+def test_rejects_other_files(tmp_path):
+    filename = tmp_path / "other.bin"
+    filename.write_bytes(b"not a capture at all")
+    with pytest.raises(ValueError):
+        CaptureReader(str(filename))
+    filename.write_bytes(CAPTURE_MAGIC[:3])
+    with pytest.raises(ValueError):
+        CaptureReader(str(filename))
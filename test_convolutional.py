@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+import convolutional as conv
+
+
+@pytest.fixture(scope="module", params=conv.RATES, ids=str)
+def coders(request):
+    return conv.encoder(rate=request.param), conv.decoder(rate=request.param)
+
+
+@pytest.mark.parametrize("length", [0, 1, 2, 7, 32, 255])
+def test_frame_round_trip(coders, length):
+    encoder, decoder = coders
+    data = np.random.default_rng(length).integers(0, 256, length, dtype=np.uint8).tobytes()
+    assert decoder.decode_frame(encoder.encode_frame(data)) == data
+
+
+@pytest.mark.parametrize("position", [0, 13, 100, -1])
+def test_corrects_one_error_after_puncturing(coders, position):
+    encoder, decoder = coders
+    message = np.random.default_rng(position % 97).integers(0, 2, (1, 256), dtype=np.uint8)
+    codeword = encoder.encode(message)
+    codeword[0, position] ^= 1
+    decoded, corrected = decoder.decode(codeword, stats=True)
+    assert np.array_equal(decoded, message)
+    assert corrected[0] == 1
+
+
+def test_batch_matches_single(coders):
+    encoder, decoder = coders
+    messages = np.random.default_rng(1).integers(0, 2, (4, 64), dtype=np.uint8)
+    codewords = encoder.encode(messages)
+    codewords[np.arange(4), [3, 20, 40, 60]] ^= 1
+    batch = decoder.decode(codewords)
+    for row in range(4):
+        assert np.array_equal(batch[row], decoder.decode(codewords[row])[0])
+    assert np.array_equal(batch, messages)
+
+
+def test_soft_input_beats_hard(coders):
+    encoder, decoder = coders
+    rng = np.random.default_rng(2)
+    messages = rng.integers(0, 2, (50, 128), dtype=np.uint8)
+    bipolar = 1 - 2 * encoder.encode(messages).astype(np.float32)
+    received = bipolar + rng.normal(0, 0.8, bipolar.shape).astype(np.float32)
+    soft = np.count_nonzero(decoder.decode(received, soft=True) != messages)
+    hard = np.count_nonzero(decoder.decode((received < 0).astype(np.uint8)) != messages)
+    assert soft < hard
+
+
+def test_soft_erasures_are_ignored(coders):
+    encoder, decoder = coders
+    message = np.random.default_rng(3).integers(0, 2, (1, 96), dtype=np.uint8)
+    received = 1 - 2 * encoder.encode(message).astype(np.float32)
+    # zero is no information, so erased values do not count as corrections
+    received[0, ::9] = 0
+    decoded, corrected = decoder.decode(received, soft=True, stats=True)
+    assert np.array_equal(decoded, message)
+    assert corrected[0] == 0
+
+
+def test_unknown_frame_length_is_uncorrectable(coders):
+    encoder, decoder = coders
+    lengths = set(decoder.frameLengths)
+    length = next(n for n in range(1, 400) if n not in lengths)
+    payload, stats = decoder.decode_frame(bytes(length), stats=True)
+    assert payload == b""
+    assert stats["uncorrectable"] == 1
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+pmt = pytest.importorskip("pmt")
+
+from ethaNET import ACK_FLAG, BROADCAST_ADDR, EthaNET
+from utils import Packet
+
+
+@pytest.fixture(scope="module")
+def ethan():
+    # nothing listens on the sockets, process_pdu() is driven directly
+    node = EthaNET(
+        source_addr=1,
+        grc_send_addr="inproc://test-ethanet-tx",
+        grc_recv_addr="inproc://test-ethanet-rx",
+    )
+    yield node
+    node.close()
+
+
+def frame(ethan, data, mcs, seq_num, flips=()):
+    coded = ethan.encoders[mcs].encode_frame(data)
+    raw = bytearray(Packet(mcs, seq_num, BROADCAST_ADDR, 2).pack(coded, data))
+    for bit in flips:
+        raw[Packet.header_size + bit // 8] ^= 0x80 >> bit % 8
+    return ethan._serialize_packet(bytes(raw))
+
+
+@pytest.mark.parametrize("mcs", [0, 5, 6, 9])
+def test_corrected_frame_is_delivered(ethan, mcs):
+    data = b"EthaNET payload with a channel error"
+    packet = ethan.process_pdu(frame(ethan, data, mcs, mcs, flips=[17]))
+    assert packet is not None
+    assert packet.payload == data
+    assert packet.fec_stats["corrected"] >= 1
+
+
+def test_uncorrectable_frame_fails_crc(ethan):
+    data = b"EthaNET payload"
+    before = ethan.rx_stats["bad_checksum"]
+    # two errors in one (7,4) codeword are beyond Hamming
+    assert ethan.process_pdu(frame(ethan, data, 0, 10, flips=[8, 9])) is None
+    assert ethan.rx_stats["bad_checksum"] == before + 1
+    assert ethan.link_quality.rates()["mcs"][0]["crc_failure_rate"] > 0
+
+
+def test_ack_template_is_accepted(ethan):
+    # the template builds the serialized PDU, prefix included
+    packet = ethan.process_pdu(ethan._ack_template.frame(3, 1, 2))
+    assert packet is not None
+    assert packet.mcs & ACK_FLAG
+    assert (packet.sequence_number, packet.source_addr) == (3, 2)
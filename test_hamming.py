@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+import hamming as hamm
+
+
+@pytest.fixture(scope="module", params=hamm.FRAME_ORDERS)
+def coders(request):
+    return hamm.encoder(order=request.param), hamm.decoder(order=request.param)
+
+
+@pytest.mark.parametrize("length", range(1, 256))
+def test_frame_round_trip(coders, length):
+    encoder, decoder = coders
+    data = np.random.default_rng(length).integers(0, 256, length, dtype=np.uint8).tobytes()
+    assert decoder.decode_frame(encoder.encode_frame(data)) == data
+
+
+@pytest.mark.parametrize("length", [1, 32, 255])
+def test_frame_corrects_one_error_per_codeword(coders, length):
+    encoder, decoder = coders
+    data = np.random.default_rng(length).integers(0, 256, length, dtype=np.uint8).tobytes()
+    bits = np.unpackbits(np.frombuffer(encoder.encode_frame(data), dtype=np.uint8))
+    numCodewords = bits.size // encoder.n
+    bits[np.arange(numCodewords) * encoder.n + length % encoder.n] ^= 1
+    assert decoder.decode_frame(np.packbits(bits).tobytes()) == data
+
+
+@pytest.mark.parametrize("order, length", [(order, 0) for order in hamm.FRAME_ORDERS] + [(3, 1)])
+def test_frame_too_short_for_pad_byte(order, length):
+    # an order 3 codeword carries 4 bits, too few for the pad byte
+    payload, stats = hamm.decoder(order=order).decode_frame(bytes(length), stats=True)
+    assert payload == b""
+    assert stats["uncorrectable"] == 1
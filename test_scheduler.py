@@ -0,0 +1,85 @@
+import threading
+
+import pytest
+
+from scheduler import (
+    POLICY_DROP,
+    PRIORITY_BULK,
+    PRIORITY_CONTROL,
+    PRIORITY_DATA,
+    TxScheduler,
+)
+
+
+def drain(scheduler, count):
+    """Start the sender loop on what is queued and return the PDUs in send order."""
+    sent = []
+    done = threading.Event()
+
+    def transmit(pdu):
+        sent.append(pdu)
+        if len(sent) == count:
+            done.set()
+
+    scheduler.transmit = transmit
+    scheduler.start()
+    assert done.wait(5)
+    scheduler.stop()
+    return sent
+
+
+def test_acks_go_first_then_priority_order():
+    scheduler = TxScheduler(None)
+    scheduler.enqueue(b"bulk", 1, PRIORITY_BULK)
+    scheduler.enqueue(b"data", 1, PRIORITY_DATA)
+    scheduler.enqueue(b"control", 1, PRIORITY_CONTROL)
+    scheduler.enqueue_ack(b"ack")
+    assert drain(scheduler, 4) == [b"ack", b"control", b"data", b"bulk"]
+
+
+def test_equal_flows_alternate():
+    scheduler = TxScheduler(None, quantum=100)
+    for i in range(4):
+        scheduler.enqueue(b"a" * 100, 1)
+        scheduler.enqueue(b"b" * 100, 2)
+    sent = drain(scheduler, 8)
+    assert [pdu[:1] for pdu in sent] == [b"a", b"b"] * 4
+
+
+def test_drr_shares_bytes_between_flows():
+    quantum = 500
+    scheduler = TxScheduler(None, quantum=quantum, max_queue_len=100)
+    # one flow of large PDUs, one of small ones, both always backlogged
+    for _ in range(20):
+        scheduler.enqueue(b"L" * 500, 1)
+    for _ in range(100):
+        scheduler.enqueue(b"s" * 100, 2)
+    sent = drain(scheduler, 120)
+
+    sent_bytes = {b"L": 0, b"s": 0}
+    for pdu in sent:
+        sent_bytes[pdu[:1]] += len(pdu)
+        if sent_bytes[b"L"] == 20 * 500 or sent_bytes[b"s"] == 100 * 100:
+            break
+        assert abs(sent_bytes[b"L"] - sent_bytes[b"s"]) <= quantum
+
+
+@pytest.mark.parametrize("priority", [PRIORITY_CONTROL, PRIORITY_BULK])
+def test_drop_policy_counts_drops(priority):
+    scheduler = TxScheduler(None, max_queue_len=2, policy=POLICY_DROP)
+    assert scheduler.enqueue(b"1", 1, priority)
+    assert scheduler.enqueue(b"2", 1, priority)
+    assert not scheduler.enqueue(b"3", 1, priority)
+    # other flows have their own queues
+    assert scheduler.enqueue(b"4", 2, priority)
+    assert scheduler.dropped[priority] == 1
+
+
+def test_latency_is_recorded_per_class():
+    scheduler = TxScheduler(None)
+    scheduler.enqueue_ack(b"ack")
+    scheduler.enqueue(b"data", 1, PRIORITY_DATA)
+    drain(scheduler, 2)
+    stats = scheduler.latency_us()
+    assert set(stats) == {"ack", PRIORITY_DATA}
+    assert stats["ack"]["count"] == 1
@@ -0,0 +1,26 @@
+import pytest
+
+from utils import AckTemplate, Packet
+
+ACK_MCS = 0x80
+CODED = bytes([0x4E, 0x1F, 0x2B, 0x61, 0x33, 0x0C])
+MESSAGE = b"ACK"
+
+
+@pytest.mark.parametrize("prefix", [b"", b"\x07\x02\x00\x00\x00\x0c"])
+@pytest.mark.parametrize(
+    "sequence_number, dest_addr, source_addr",
+    [(0, 0, 0), (1, 2, 3), (255, 255, 255), (17, 128, 64), (200, 1, 254)],
+)
+def test_ack_template_matches_pack(prefix, sequence_number, dest_addr, source_addr):
+    template = AckTemplate(ACK_MCS, CODED, MESSAGE, prefix)
+    expected = Packet(ACK_MCS, sequence_number, dest_addr, source_addr).pack(CODED, MESSAGE)
+    assert template.frame(sequence_number, dest_addr, source_addr) == prefix + expected
+
+
+def test_ack_template_is_reusable():
+    template = AckTemplate(ACK_MCS, CODED, MESSAGE)
+    template.frame(9, 9, 9)
+    expected = Packet(ACK_MCS, 1, 2, 3).pack(CODED, MESSAGE)
+    assert template.frame(1, 2, 3) == expected
+
@@ -49,6 +49,8 @@ class Packet:
         self.checksum = checksum
         self.message_length = message_length
         self.payload = None
+        # FEC statistics of a received payload, filled in when it is decoded
+        self.fec_stats = None
 
     def __str__(self) -> str:
         return f"mcs: {self.mcs}, seqNum: {self.sequence_number}, d_addr: {self.dest_addr}, s_addr: {self.source_addr}, len: {self.message_length}, payload: {self.payload}"
@@ -85,8 +87,15 @@ class Packet:
             payload,
         )
 
-    def pack(self, payload: bytes) -> bytes:
-        """Complete header and package header and payload together."""
+    def pack(self, payload: bytes, message: bytes = None) -> bytes:
+        """Complete header and package header and payload together.
+
+        Args:
+            payload (bytes): coded payload that is sent
+            message (bytes): decoded payload the CRC covers, the payload itself if None
+        """
+        if message is None:
+            message = payload
         self.message_length = len(payload)
 
         if not 0 < self.message_length < 256:
@@ -101,7 +110,7 @@ class Packet:
             self.sequence_number,
             self.dest_addr,
             self.source_addr,
-            payload,
+            message,
         )
 
         return self.allBytes()
@@ -138,14 +147,68 @@ class Packet:
         header = cls(
             mcs=mcs,
             sequence_number=sequence_number,
-            checksum=checksum,
+            checksum=checksum.to_bytes(1, "big"),
             message_length=message_length,
             dest_addr=d_addr,
             source_addr=s_addr,
         )
 
         return header
-    
+
+
+class AckTemplate:
+    """Precomputed ACK frame where only SEQ, DES, SRC and CRC change per ACK.
+
+    CRC-8 is affine over GF(2), so the checksum of a filled in template is the
+    template checksum XOR one table lookup per variable field.
+    """
+
+    # byte offsets of the variable fields within the header
+    seq_offset, dest_offset, source_offset, checksum_offset = 2, 3, 4, 5
+
+    def __init__(self, mcs: int, coded_payload: bytes, message: bytes, prefix: bytes = b""):
+        base = Packet(mcs, 0, 0, 0)
+        frame = base.pack(coded_payload, message)
+
+        # prefix holds any serialization envelope the frame is sent in
+        self.prefix_size = len(prefix)
+        self._frame = bytearray(prefix + frame)
+        self._base_checksum = ord(base.checksum)
+        self._seq_table = self._field_table(base, message, "sequence_number")
+        self._dest_table = self._field_table(base, message, "dest_addr")
+        self._source_table = self._field_table(base, message, "source_addr")
+
+    def _field_table(self, base: Packet, payload: bytes, field: str) -> list:
+        """Checksum contribution of every value of one header field."""
+        fields = {
+            "mcs": base.mcs,
+            "message_length": base.message_length,
+            "sequence_number": 0,
+            "dest_addr": 0,
+            "source_addr": 0,
+            "payload": payload,
+        }
+        table = []
+        for value in range(256):
+            fields[field] = value
+            table.append(ord(Packet.calculate_checksum(**fields)) ^ self._base_checksum)
+        return table
+
+    def frame(self, sequence_number: int, dest_addr: int, source_addr: int) -> bytes:
+        """Fill in the template and return the (prefixed) ACK frame."""
+        o = self.prefix_size
+        frame = self._frame
+        frame[o + self.seq_offset] = sequence_number
+        frame[o + self.dest_offset] = dest_addr
+        frame[o + self.source_offset] = source_addr
+        frame[o + self.checksum_offset] = (
+            self._base_checksum
+            ^ self._seq_table[sequence_number]
+            ^ self._dest_table[dest_addr]
+            ^ self._source_table[source_addr]
+        )
+        return bytes(frame)
+
 
 def bytes_to_bit_list(byte_data):
     """Convert a byte string or list of bytes into a list of 1s and 0s."""